@@ -4,10 +4,118 @@
 import os
 import logging
 from raspiot.utils import MessageRequest, MessageResponse, NoResponse, InvalidModule
-from threading import Thread
+from threading import Thread, Lock
 from collections import deque
 import time
 import traceback
+import sys
+import random
+from ratelimit import TokenBucket
+import resource
+try:
+    import tracemalloc
+except ImportError:
+    #tracemalloc is only available with python>=3.4 (or patched python2 with pytracemalloc)
+    tracemalloc = None
+
+#getrusage thread accounting is linux only (constant not exposed by python2)
+RUSAGE_THREAD = getattr(resource, u'RUSAGE_THREAD', 1)
+
+def thread_cpu_time():
+    """
+    Return cpu time consumed by current thread
+    Process cpu time is returned if thread accounting is not supported by system
+
+    Returns:
+        float: user and system cpu time (seconds)
+    """
+    try:
+        usage = resource.getrusage(RUSAGE_THREAD)
+        return usage.ru_utime + usage.ru_stime
+    except (ValueError, resource.error):
+        return time.clock()
+
+
+
+
+class MemorySampler():
+    """
+    Measure memory allocated by script lines during its execution using tracemalloc
+    Tracing is process wide: it is started by first running sampler and stopped by last one
+    """
+
+    _lock = Lock()
+    _samplers = 0
+    _tracing_started = False
+
+    def __init__(self, script):
+        """
+        Constructor
+
+        Args:
+            script (string): full script path
+        """
+        self.script = script
+        self.__snapshot = None
+
+    @staticmethod
+    def is_available():
+        """
+        Return memory accounting availability
+
+        Returns:
+            bool: True if tracemalloc is available
+        """
+        return tracemalloc is not None
+
+    def __take_snapshot(self):
+        """
+        Take snapshot of memory blocks allocated by script
+
+        Returns:
+            Snapshot: tracemalloc snapshot
+        """
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, self.script)])
+
+    def start(self):
+        """
+        Start sampling
+        """
+        MemorySampler._lock.acquire()
+        try:
+            if MemorySampler._samplers==0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                MemorySampler._tracing_started = True
+            MemorySampler._samplers += 1
+        finally:
+            MemorySampler._lock.release()
+
+        self.__snapshot = self.__take_snapshot()
+
+    def stop(self):
+        """
+        Stop sampling
+
+        Returns:
+            int: memory allocated by script and still in use at end of execution (bytes)
+        """
+        try:
+            snapshot = self.__take_snapshot()
+            stats = snapshot.compare_to(self.__snapshot, u'filename')
+            return max(0, sum([stat.size_diff for stat in stats]))
+        finally:
+            self.__snapshot = None
+            MemorySampler._lock.acquire()
+            try:
+                MemorySampler._samplers -= 1
+                if MemorySampler._samplers==0 and MemorySampler._tracing_started:
+                    tracemalloc.stop()
+                    MemorySampler._tracing_started = False
+            finally:
+                MemorySampler._lock.release()
+
+
+
 
 class ActionDebugLogger():
     """
@@ -123,15 +231,23 @@ class ActionDebugLogger():
 
 
 
-class Action(Thread):
+class Action():
     """
     Action class launches isolated thread for an action
     It handles 2 kinds of process:
      - if debug parameter is True, Action instance runs action once and allows you to get output traces
      - if debug parameter is False, Action instance runs undefinitely (until end of raspiot)
+
+    In non debug mode, thread is started lazily when first event is pushed and it is released
+    (hibernated) after idle_timeout seconds without event. It is started again on next event.
+    Script variables kept between executions are lost when thread is released.
+    Every action receives all events, so idle_timeout must be shorter than time event period (1 minute).
+    Disabled action never starts its thread.
     """
 
-    def __init__(self, script, bus_push, disabled, debug=False, debug_event=None):
+    EMIT_MAX_DEPTH = 8
+
+    def __init__(self, script, bus_push, disabled, debug=False, debug_event=None, idle_timeout=None, limit_callback=None, execution_callback=None, emit_callback=None):
         """
         Constructor
 
@@ -141,9 +257,14 @@ class Action(Thread):
             disabled (bool): script disabled status
             debug (bool): set to True to execute this script once
             debug_event (MessageRequest): event that trigger script
+            idle_timeout (float): idle duration before releasing thread (seconds). None to keep thread alive
+            limit_callback (function): function called with script name and reason when a resources limit is exceeded
+            execution_callback (function): function called after each execution with script name, event name,
+                start timestamp, duration and error summary (None if execution succeed)
+            emit_callback (function): function called with event emitted by script and forward flag to route it
+                to other actions (or to message bus if forward flag is set)
         """
         #init
-        Thread.__init__(self)
         self.logger = logging.getLogger(os.path.basename(script))
 
         #members
@@ -155,9 +276,87 @@ class Action(Thread):
         self.__events = deque()
         self.__continu = True
         self.__disabled = disabled
+        self.__idle_timeout = idle_timeout
+        self.__thread = None
+        self.__thread_lock = Lock()
+        self.__limit_callback = limit_callback
+        self.__execution_callback = execution_callback
+        self.__emit_callback = emit_callback
+        self.__current_chain = []
+        self.__cpu_limit = None
+        self.__memory_limit = None
+        self.__memory_sample_rate = 0.0
+        self.__command_bucket = None
+        self.__global_command_bucket = None
+        self.__command_blocking = True
         self.last_execution = None
         self.error_occured = False
         self.logger_level = logging.INFO
+        self.__stats = {
+            u'events': 0,
+            u'dropped': 0,
+            u'chained': 0,
+            u'executions': 0,
+            u'errors': 0,
+            u'duration': 0.0,
+            u'maxduration': 0.0,
+            u'latency': 0.0,
+            u'maxlatency': 0.0,
+            u'cputime': 0.0,
+            u'maxcputime': 0.0,
+            u'samples': 0,
+            u'memory': 0,
+            u'maxmemory': 0,
+            u'commands': 0,
+            u'throttled': 0,
+            u'rejected': 0,
+        }
+
+    def start(self):
+        """
+        Start action thread immediately
+        """
+        self.__thread_lock.acquire()
+        try:
+            self.__start_thread()
+        finally:
+            self.__thread_lock.release()
+
+    def __start_thread(self):
+        """
+        Start action thread if not running. Thread lock must be acquired
+        """
+        if not self.__continu:
+            return
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__thread = Thread(target=self.run, name=os.path.basename(self.script))
+            self.__thread.start()
+
+    def __hibernate(self):
+        """
+        Release action thread if no event is pending
+
+        Returns:
+            bool: True if thread can be released
+        """
+        self.__thread_lock.acquire()
+        try:
+            if len(self.__events)>0:
+                return False
+            self.__thread = None
+            return True
+        finally:
+            self.__thread_lock.release()
+
+    def is_alive(self):
+        """
+        Return action thread status
+
+        Returns:
+            bool: True if thread is running
+        """
+        thread = self.__thread
+        return thread is not None and thread.is_alive()
 
     def stop(self):
         """
@@ -175,14 +374,92 @@ class Action(Thread):
             {
                 timestamp (str): last execution time
                 error (bool): True if last execution failed
+                running (bool): True if action thread is running (False if hibernated)
+                commands (int): number of commands sent to bus
+                throttled (int): number of commands delayed by rate limits
+                rejected (int): number of commands rejected by rate limits
             }
 
         """
         return {
             u'timestamp': self.last_execution,
             u'error': self.error_occured,
+            u'running': self.is_alive(),
+            u'commands': self.__stats[u'commands'],
+            u'throttled': self.__stats[u'throttled'],
+            u'rejected': self.__stats[u'rejected'],
+        }
+
+    def get_execution_stats(self):
+        """
+        Get execution statistics since action start
+
+        Returns:
+            dict: execution statistics::
+
+            {
+                events (int): number of processed events (including dropped ones), excluding events emitted by scripts
+                dropped (int): number of events dropped because action was disabled, excluding events emitted by scripts
+                chained (int): number of received events emitted by other scripts (processed or dropped)
+                executions (int): number of script executions
+                errors (int): number of failed executions
+                duration (float): cumulated execution duration (seconds)
+                maxduration (float): longest execution duration (seconds)
+                latency (float): cumulated latency between event push and end of execution (seconds)
+                maxlatency (float): longest latency (seconds)
+                cputime (float): cumulated thread cpu time (seconds)
+                maxcputime (float): highest thread cpu time of single execution (seconds)
+                samples (int): number of executions sampled for memory accounting
+                memory (int): cumulated memory allocated by script during sampled executions (bytes)
+                maxmemory (int): highest memory allocated during single sampled execution (bytes)
+                commands (int): number of commands sent to bus
+                throttled (int): number of commands delayed by rate limits
+                rejected (int): number of commands rejected by rate limits
+            }
+
+        """
+        return self.__stats.copy()
+
+    def get_resources_usage(self):
+        """
+        Get resources consumed by script
+
+        Returns:
+            dict: resources usage::
+
+            {
+                cputime (float): cumulated thread cpu time (seconds)
+                avgcputime (float): average cpu time per execution (seconds)
+                maxcputime (float): highest cpu time of single execution (seconds)
+                avgmemory (int): average memory allocated per sampled execution (bytes) or None if no sample
+                maxmemory (int): highest memory allocated during single sampled execution (bytes) or None if no sample
+            }
+
+        """
+        stats = self.__stats.copy()
+        executions = stats[u'executions']
+        samples = stats[u'samples']
+        return {
+            u'cputime': stats[u'cputime'],
+            u'avgcputime': stats[u'cputime'] / executions if executions>0 else 0.0,
+            u'maxcputime': stats[u'maxcputime'],
+            u'avgmemory': stats[u'memory'] / samples if samples>0 else None,
+            u'maxmemory': stats[u'maxmemory'] if samples>0 else None,
         }
 
+    def set_resources_limits(self, cpu_limit, memory_limit, memory_sample_rate):
+        """
+        Set resources soft limits. Limit callback is called when limit is exceeded
+
+        Args:
+            cpu_limit (float): max thread cpu time for single execution (seconds). None to disable limit
+            memory_limit (int): max memory allocated during single sampled execution (bytes). None to disable limit
+            memory_sample_rate (float): ratio of executions sampled for memory accounting (0.0 to 1.0)
+        """
+        self.__cpu_limit = cpu_limit
+        self.__memory_limit = memory_limit
+        self.__memory_sample_rate = memory_sample_rate
+
     def set_debug_level(self, level):
         """
         Set debug level
@@ -192,6 +469,15 @@ class Action(Thread):
         """
         self.logger_level = level
 
+    def set_idle_timeout(self, idle_timeout):
+        """
+        Set idle duration before releasing action thread
+
+        Args:
+            idle_timeout (float): idle duration (seconds). None to keep thread alive
+        """
+        self.__idle_timeout = idle_timeout
+
     def set_disabled(self, disabled):
         """
         Disable/enable script
@@ -210,6 +496,69 @@ class Action(Thread):
         """
         return self.__disabled
 
+    def set_command_rate_limits(self, rate, burst, global_bucket=None, blocking=True):
+        """
+        Set outbound commands rate limits
+
+        Args:
+            rate (float): max number of commands per second for this script. 0 to disable script limit
+            burst (int): number of commands that can be sent at once before being limited
+            global_bucket (TokenBucket): bucket shared by all actions. None to disable global limit
+            blocking (bool): True to wait until command can be sent, False to fail immediately
+        """
+        self.__command_bucket = TokenBucket(rate, burst) if rate>0 else None
+        self.__global_command_bucket = global_bucket
+        self.__command_blocking = blocking
+
+    def __throttle_command(self):
+        """
+        Wait until command is allowed by rate limits
+
+        Raises:
+            Exception: if command is rejected (fail fast mode or action stopped)
+        """
+        throttled = False
+        while True:
+            delay = 0.0
+            if self.__command_bucket:
+                delay = self.__command_bucket.consume()
+            if delay==0.0 and self.__global_command_bucket:
+                delay = self.__global_command_bucket.consume()
+                if delay>0.0 and self.__command_bucket:
+                    #give back script token, command is not sent
+                    self.__command_bucket.refund()
+            if delay==0.0:
+                break
+
+            if not self.__command_blocking or not self.__continu:
+                self.__stats[u'rejected'] += 1
+                raise Exception(u'Command rate limit exceeded')
+            if not throttled:
+                throttled = True
+                self.__stats[u'throttled'] += 1
+            time.sleep(delay)
+
+        self.__stats[u'commands'] += 1
+
+    def __check_limits(self, cputime, memory):
+        """
+        Check resources consumed by last execution and call limit callback if limit is exceeded
+
+        Args:
+            cputime (float): execution cpu time (seconds)
+            memory (int): execution allocated memory (bytes) or None if execution was not sampled
+        """
+        reason = None
+        if self.__cpu_limit and cputime>self.__cpu_limit:
+            reason = u'cpu time %.3fs exceeds %.3fs' % (cputime, self.__cpu_limit)
+        elif self.__memory_limit and memory is not None and memory>self.__memory_limit:
+            reason = u'allocated memory %d bytes exceeds %d bytes' % (memory, self.__memory_limit)
+
+        if reason:
+            self.logger.warning(u'Action script "%s" exceeds resources limit: %s' % (self.script, reason))
+            if self.__limit_callback:
+                self.__limit_callback(os.path.basename(self.script), reason)
+
     def push_event(self, event):
         """
         Event received
@@ -217,7 +566,17 @@ class Action(Thread):
         Args:
             event (MessageRequest): message instance
         """
-        self.__events.appendleft(event)
+        #drop event without starting thread if script disabled
+        if self.__disabled:
+            self.__stats[u'chained' if u'chain' in event else u'dropped'] += 1
+            return
+
+        self.__thread_lock.acquire()
+        try:
+            self.__events.appendleft((event, time.time()))
+            self.__start_thread()
+        finally:
+            self.__thread_lock.release()
 
     def run(self):
         """
@@ -238,6 +597,9 @@ class Action(Thread):
             request.to = to
             request.params = params
 
+            #apply rate limits
+            self.__throttle_command()
+
             #push message
             resp = MessageResponse()
             try:
@@ -253,6 +615,26 @@ class Action(Thread):
             else:
                 return resp
 
+        #emit event helper
+        def emit(name, values=None, forward=False):
+            if not self.__emit_callback:
+                raise Exception(u'Emit is not available')
+
+            #keep track of scripts that led to this event (also for forwarded events that come back from bus)
+            chain = self.__current_chain + [os.path.basename(self.script)]
+            if len(chain)>Action.EMIT_MAX_DEPTH:
+                raise Exception(u'Max emit depth reached (%s)' % u' > '.join(chain))
+
+            #forwarded event is sent to message bus: apply rate limits
+            if forward:
+                self.__throttle_command()
+
+            self.__emit_callback({
+                u'event': name,
+                u'params': values or {},
+                u'chain': chain,
+            }, forward)
+
         if self.__debug:
             #event in queue, get event
             self.logger.debug(u'Action execution')
@@ -275,7 +657,8 @@ class Action(Thread):
             #logger helper
             logger = self.logger
 
-            #loop forever
+            #loop until stopped or idle
+            idle_since = time.time()
             while self.__continu:
                 if len(self.__events)>0:
                     #check if file exists
@@ -284,7 +667,9 @@ class Action(Thread):
                         break
 
                     #event in queue, process it
-                    current_event = self.__events.pop()
+                    (current_event, pushed_at) = self.__events.pop()
+                    self.__stats[u'chained' if u'chain' in current_event else u'events'] += 1
+                    self.__current_chain = current_event.get(u'chain', [])
 
                     #drop script execution if script disabled
                     if self.__disabled:
@@ -298,14 +683,56 @@ class Action(Thread):
                     
                     #and execute file
                     self.logger.debug(u'Action execution')
+                    sampler = None
+                    if tracemalloc and self.__memory_sample_rate>0 and random.random()<self.__memory_sample_rate:
+                        sampler = MemorySampler(self.script)
+                        sampler.start()
+                    start = time.time()
+                    cpu_start = thread_cpu_time()
+                    error = None
                     try:
                         execfile(self.script)
                         self.last_execution = int(time.time())
                         self.error_occured = False
                     except:
                         self.error_occured = True
+                        error = traceback.format_exception_only(*sys.exc_info()[:2])[-1].strip()
+                        self.__stats[u'errors'] += 1
                         self.logger.exception(u'Fatal error in action script "%s"' % self.script)
 
+                    #update stats
+                    cputime = thread_cpu_time() - cpu_start
+                    end = time.time()
+                    memory = sampler.stop() if sampler else None
+                    self.__stats[u'executions'] += 1
+                    self.__stats[u'duration'] += end - start
+                    self.__stats[u'maxduration'] = max(self.__stats[u'maxduration'], end - start)
+                    self.__stats[u'latency'] += end - pushed_at
+                    self.__stats[u'maxlatency'] = max(self.__stats[u'maxlatency'], end - pushed_at)
+                    self.__stats[u'cputime'] += cputime
+                    self.__stats[u'maxcputime'] = max(self.__stats[u'maxcputime'], cputime)
+                    if memory is not None:
+                        self.__stats[u'samples'] += 1
+                        self.__stats[u'memory'] += memory
+                        self.__stats[u'maxmemory'] = max(self.__stats[u'maxmemory'], memory)
+
+                    #report execution
+                    if self.__execution_callback:
+                        try:
+                            self.__execution_callback(os.path.basename(self.script), event, start, end - start, error)
+                        except:
+                            self.logger.exception(u'Error reporting execution of action script "%s"' % self.script)
+
+                    #check resources limits
+                    self.__check_limits(cputime, memory)
+
+                    idle_since = time.time()
+
+                elif self.__idle_timeout is not None and time.time()-idle_since>=self.__idle_timeout and self.__hibernate():
+                    #no event for too long, release thread
+                    self.logger.debug(u'Action is idle, hibernate thread')
+                    break
+
                 else:
                     #no event, pause
                     time.sleep(0.50)
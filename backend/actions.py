@@ -3,16 +3,70 @@
     
 import os
 import logging
-from raspiot.utils import InvalidParameter, CommandError
+from raspiot.utils import InvalidParameter, CommandError, MessageRequest
 from raspiot.raspiot import RaspIotModule
-from threading import Lock
+from threading import Lock, Thread
 import time
 import re
+import zipfile
+import tarfile
+import tempfile
+import uuid
 from raspiot.libs.internals.task import Task
-from action import Action
+from action import Action, MemorySampler
+from recorder import EventRecorder, EventReplayer
+from ratelimit import TokenBucket
+from history import ExecutionHistory
 
 __all__ = ['Actions']
 
+def get_archive_scripts(filepath):
+    """
+    Read python scripts stored in zip or tar archive. Directories are ignored
+
+    Args:
+        filepath (string): archive path
+
+    Returns:
+        dict: scripts content (unicode) by script name
+
+    Raises:
+        InvalidParameter: if archive format is not supported or if archive content is invalid
+    """
+    members = []
+    if zipfile.is_zipfile(filepath):
+        with zipfile.ZipFile(filepath, u'r') as archive:
+            for member in archive.infolist():
+                name = os.path.basename(member.filename)
+                if os.path.splitext(name)[1]==u'.py':
+                    members.append((name, archive.read(member)))
+    elif tarfile.is_tarfile(filepath):
+        archive = tarfile.open(filepath, u'r:*')
+        try:
+            for member in archive.getmembers():
+                name = os.path.basename(member.name)
+                if member.isfile() and os.path.splitext(name)[1]==u'.py':
+                    members.append((name, archive.extractfile(member).read()))
+        finally:
+            archive.close()
+    else:
+        raise InvalidParameter(u'Invalid archive uploaded (only zip and tar archives are supported)')
+
+    #validate all scripts before anything is written
+    scripts = {}
+    for name, content in members:
+        if name in scripts:
+            raise InvalidParameter(u'Invalid archive uploaded (script "%s" found several times)' % name)
+        try:
+            scripts[name] = content.decode(u'utf-8')
+        except UnicodeDecodeError:
+            raise InvalidParameter(u'Invalid archive uploaded (script "%s" is not utf-8 encoded)' % name)
+
+    return scripts
+
+
+
+
 class Actions(RaspIotModule):
     """
     Actions application allows user to execute its own python scripts interacting with Cleep
@@ -37,9 +91,23 @@ class Actions(RaspIotModule):
 
     MODULE_CONFIG_FILE = u'actions.conf'
 
+    FORWARDED_EVENT_TIMEOUT = 10.0
+    FORWARDED_EVENT_ID = u'emitid'
+
     SCRIPTS_PATH = u'/var/opt/raspiot/actions'
+    RECORDINGS_PATH = u'/var/opt/raspiot/actions_recordings'
+    HISTORY_PATH = u'/var/opt/raspiot/actions_history.log'
     DEFAULT_CONFIG = {
-        u'scripts': {}
+        u'scripts': {},
+        u'idle_timeout': 0.0,
+        u'cpu_limit': 0.0,
+        u'memory_limit': 0,
+        u'memory_sample_rate': 0.1,
+        u'command_rate': 0.0,
+        u'command_burst': 10,
+        u'global_command_rate': 0.0,
+        u'global_command_burst': 50,
+        u'command_rate_blocking': True
     }
 
     def __init__(self, bootstrap, debug_enabled):
@@ -60,11 +128,29 @@ class Actions(RaspIotModule):
         #init members
         self.__scripts = {}
         self.__load_scripts_lock = Lock()
+        self.__recorder = None
+        self.__replayer = None
+        self.__replay_status = {
+            u'running': False,
+            u'filename': None,
+            u'report': None,
+            u'error': None
+        }
+        self.__global_command_bucket = None
+        self.__forwarded_events = {}
+        self.__forwarded_events_lock = Lock()
+        self.__history = ExecutionHistory(self.cleep_filesystem, Actions.HISTORY_PATH)
 
     def _configure(self):
         """
         Configure module
         """
+        #global commands rate limit
+        self.__global_command_bucket = self.__get_global_command_bucket()
+
+        #load execution history
+        self.__history.load()
+
         #launch scripts threads
         self.__load_scripts()
 
@@ -72,6 +158,10 @@ class Actions(RaspIotModule):
         self.__refresh_thread = Task(60.0, self.__load_scripts, self.logger)
         self.__refresh_thread.start()
 
+        #execution history flush task
+        self.__history_thread = Task(ExecutionHistory.FLUSH_INTERVAL, self.__history.flush, self.logger)
+        self.__history_thread.start()
+
     def _stop(self):
         """
         Stop module
@@ -79,18 +169,108 @@ class Actions(RaspIotModule):
         #stop refresh thread
         self.__refresh_thread.stop()
 
+        #stop events recording and replay
+        if self.__recorder:
+            self.__recorder.stop()
+        if self.__replayer:
+            self.__replayer.stop()
+
         #stop all scripts
         for script in self.__scripts:
             self.__scripts[script].stop()
 
+        #write pending execution history
+        self.__history_thread.stop()
+        self.__history.flush()
+
+    def __get_config_value(self, field):
+        """
+        Return config field value, falling back to default value for fields missing in older config files
+
+        Args:
+            field (string): config field name
+
+        Returns:
+            any: field value
+        """
+        return self._get_config().get(field, Actions.DEFAULT_CONFIG[field])
+
+    def __get_idle_timeout(self):
+        """
+        Return configured idle timeout
+
+        Returns:
+            float: idle timeout (seconds) or None if scripts threads must never be released
+        """
+        idle_timeout = self.__get_config_value(u'idle_timeout')
+        if not idle_timeout or idle_timeout<=0:
+            return None
+
+        return idle_timeout
+
+    def __apply_resources_limits(self, action):
+        """
+        Apply configured resources limits to specified action
+
+        Args:
+            action (Action): action instance
+        """
+        action.set_resources_limits(
+            self.__get_config_value(u'cpu_limit') or None,
+            (self.__get_config_value(u'memory_limit') or None) if MemorySampler.is_available() else None,
+            self.__get_config_value(u'memory_sample_rate')
+        )
+
+    def __get_global_command_bucket(self):
+        """
+        Return token bucket shared by all actions according to configured global commands rate
+
+        Returns:
+            TokenBucket: bucket instance or None if global rate is not limited
+        """
+        rate = self.__get_config_value(u'global_command_rate')
+        if not rate or rate<=0:
+            return None
+
+        return TokenBucket(rate, self.__get_config_value(u'global_command_burst'))
+
+    def __apply_command_rate_limits(self, action):
+        """
+        Apply configured commands rate limits to specified action
+
+        Args:
+            action (Action): action instance
+        """
+        action.set_command_rate_limits(
+            self.__get_config_value(u'command_rate') or 0.0,
+            self.__get_config_value(u'command_burst'),
+            self.__global_command_bucket,
+            self.__get_config_value(u'command_rate_blocking')
+        )
+
+    def __on_limit_exceeded(self, script, reason):
+        """
+        Called by action when script exceeds resources limit. Script is disabled
+
+        Args:
+            script (string): script name
+            reason (string): exceeded limit description
+        """
+        self.logger.warning(u'Script "%s" is disabled because it exceeds resources limit: %s' % (script, reason))
+        try:
+            self.disable_script(script, True)
+        except:
+            self.logger.exception(u'Unable to disable script "%s"' % script)
+
     def __load_scripts(self):
         """
-        Launch dedicated thread for each script found
+        Create action for each script found. Action thread is only started when an event is received
         """
         self.__load_scripts_lock.acquire()
 
         #remove stopped threads (script was removed?)
         scripts = self._get_config_field(u'scripts')
+        config_changed = False
         for script in self.__scripts.keys():
             #check file existance
             if not os.path.exists(os.path.join(Actions.SCRIPTS_PATH, script)):
@@ -98,26 +278,25 @@ class Actions(RaspIotModule):
                 self.logger.info(u'Delete infos from removed script "%s"' % script)
 
                 if script in self.__scripts:
-                    #stop running thread if necessary
-                    if self.__scripts[script].is_alive():
-                        self.__scripts[script].stop()
+                    #stop thread (and prevent it from being started again)
+                    self.__scripts[script].stop()
 
                     #clear config entry
                     del self.__scripts[script]
                     if script in scripts:
                         del scripts[script]
-                        self._set_config_field(u'scripts', scripts)
+                        config_changed = True
                     
-        #launch thread for new script
-        for root, dirs, scripts in os.walk(Actions.SCRIPTS_PATH):
-            for script in scripts:
+        #create action for new script
+        idle_timeout = self.__get_idle_timeout()
+        for root, dirs, files in os.walk(Actions.SCRIPTS_PATH):
+            for script in files:
                 #drop files that aren't python script
                 ext = os.path.splitext(script)[1]
                 if ext!=u'.py':
                     self.logger.debug(u'Drop bad extension file "%s"' % script)
                     continue
 
-                scripts = self._get_config_field(u'scripts')
                 if not self.__scripts.has_key(script):
                     self.logger.info(u'Discover new script "%s"' % script)
                     #get disable status
@@ -128,11 +307,16 @@ class Actions(RaspIotModule):
                         scripts[script] = {
                             u'disabled': disabled
                         }
-                        self._set_config_field(u'scripts', scripts)
+                        config_changed = True
+
+                    #create new action (thread is started lazily)
+                    self.__scripts[script] = Action(os.path.join(root, script), self.push, disabled, idle_timeout=idle_timeout, limit_callback=self.__on_limit_exceeded, execution_callback=self.__history.add, emit_callback=self.__route_event)
+                    self.__apply_resources_limits(self.__scripts[script])
+                    self.__apply_command_rate_limits(self.__scripts[script])
 
-                    #start new thread
-                    self.__scripts[script] = Action(os.path.join(root, script), self.push, disabled)
-                    self.__scripts[script].start()
+        #save config once
+        if config_changed:
+            self._set_config_field(u'scripts', scripts)
 
         self.__load_scripts_lock.release()
 
@@ -145,6 +329,16 @@ class Actions(RaspIotModule):
         """
         config = {}
         config[u'scripts'] = self.get_scripts()
+        config[u'idletimeout'] = self.__get_config_value(u'idle_timeout')
+        config[u'cpulimit'] = self.__get_config_value(u'cpu_limit')
+        config[u'memorylimit'] = self.__get_config_value(u'memory_limit')
+        config[u'memoryaccounting'] = MemorySampler.is_available()
+        config[u'memorysamplerate'] = self.__get_config_value(u'memory_sample_rate')
+        config[u'commandrate'] = self.__get_config_value(u'command_rate')
+        config[u'commandburst'] = self.__get_config_value(u'command_burst')
+        config[u'globalcommandrate'] = self.__get_config_value(u'global_command_rate')
+        config[u'globalcommandburst'] = self.__get_config_value(u'global_command_burst')
+        config[u'commandrateblocking'] = self.__get_config_value(u'command_rate_blocking')
         return config
 
     def event_received(self, event):
@@ -155,10 +349,91 @@ class Actions(RaspIotModule):
             event (MessageRequest): an event
         """
         self.logger.debug(u'Event received %s' % unicode(event))
+        #record event
+        if self.__recorder:
+            self.__recorder.record(event)
+
+        #event forwarded by script that comes back from bus: restore its chain to avoid cycles
+        params = event.get(u'params') if isinstance(event, dict) else None
+        if isinstance(params, dict) and Actions.FORWARDED_EVENT_ID in params:
+            event = dict(event)
+            event[u'params'] = dict(params)
+            chain = self.__pop_forwarded_event_chain(event[u'params'].pop(Actions.FORWARDED_EVENT_ID))
+            if chain is not None:
+                event[u'chain'] = chain
+                self.__route_event(event, False)
+                return
+
         #push event to all script threads
         for script in self.__scripts:
             self.__scripts[script].push_event(event)
 
+    def __pop_forwarded_event_chain(self, emit_id):
+        """
+        Return chain of event previously forwarded to bus by script
+
+        Args:
+            emit_id (string): forwarded event identifier found in event params
+
+        Returns:
+            list: scripts chain or None if event is unknown (or expired)
+        """
+        self.__forwarded_events_lock.acquire()
+        try:
+            pending = self.__forwarded_events.pop(emit_id, None)
+        finally:
+            self.__forwarded_events_lock.release()
+
+        return pending[1] if pending else None
+
+    def __route_event(self, event, forward):
+        """
+        Route event emitted by script directly to other scripts, without using message bus.
+        Scripts that already appear in event chain don't receive it to avoid cycles.
+
+        Forwarded event is sent to message bus instead, with unique identifier added to its params
+        (FORWARDED_EVENT_ID key). Its chain is kept until it comes back through event_received so
+        cycle detection and depth limit still apply. Chains of events that never come back are
+        dropped after FORWARDED_EVENT_TIMEOUT seconds.
+
+        Args:
+            event (dict): emitted event::
+
+                {
+                    event (string): event name
+                    params (dict): event values
+                    chain (list): names of scripts that led to this event (emitter is last one)
+                }
+
+            forward (bool): True to send event to message bus
+        """
+        if forward:
+            self.logger.debug(u'Forward emitted event %s' % unicode(event))
+            emit_id = uuid.uuid4().hex
+            now = time.time()
+            self.__forwarded_events_lock.acquire()
+            try:
+                #drop expired entries (event never came back from bus)
+                for key, (timestamp, chain) in self.__forwarded_events.items():
+                    if now-timestamp>=Actions.FORWARDED_EVENT_TIMEOUT:
+                        del self.__forwarded_events[key]
+                self.__forwarded_events[emit_id] = (now, event[u'chain'])
+            finally:
+                self.__forwarded_events_lock.release()
+
+            request = MessageRequest()
+            request.event = event[u'event']
+            request.params = dict(event[u'params'])
+            request.params[Actions.FORWARDED_EVENT_ID] = emit_id
+            self.push(request)
+            return
+
+        self.logger.debug(u'Route emitted event %s' % unicode(event))
+        for script, action in self.__scripts.items():
+            if script in event[u'chain']:
+                continue
+            action.push_event(event)
+
     def get_script(self, script):
         """
         Return a script
@@ -251,9 +526,12 @@ class Actions(RaspIotModule):
         #force script loading
         self.__load_scripts()
 
-    def get_scripts(self):
+    def get_scripts(self, sort=None):
         """
         Return scripts
+
+        Args:
+            sort (string): sort scripts by consumed resources to get top offenders first (cpu|memory). None to keep natural order
         
         Returns:
             list: list of scripts::
@@ -263,22 +541,148 @@ class Actions(RaspIotModule):
                         name (string): script name
                         lastexecution (timestamp): last execution time
                         disabled (bool): True if script is disabled
+                        resources (dict): consumed resources (see Action.get_resources_usage)
                     },
                     ...
                 ]
 
+        Raises:
+            InvalidParameter: if parameter is invalid
         """
+        if sort not in (None, u'cpu', u'memory'):
+            raise InvalidParameter(u'Sort parameter must be "cpu" or "memory"')
+        if sort==u'memory' and not MemorySampler.is_available():
+            raise InvalidParameter(u'Memory accounting is not available on this system')
+
         scripts = []
-        for script in self.__scripts:
+        for script in self.__scripts.keys():
             script = {
                 u'name': script,
                 u'status': self.__scripts[script].get_execution_status(),
-                u'disabled': self.__scripts[script].is_disabled()
+                u'disabled': self.__scripts[script].is_disabled(),
+                u'resources': self.__scripts[script].get_resources_usage()
             }
             scripts.append(script)
 
+        if sort==u'cpu':
+            scripts.sort(key=lambda script: script[u'resources'][u'cputime'], reverse=True)
+        elif sort==u'memory':
+            scripts.sort(key=lambda script: script[u'resources'][u'maxmemory'] or 0, reverse=True)
+
         return scripts
 
+    def set_resources_limits(self, cpu_limit, memory_limit, memory_sample_rate=None):
+        """
+        Set resources soft limits. Script exceeding a limit during single execution is automatically disabled
+
+        Args:
+            cpu_limit (float): max thread cpu time per execution (seconds). 0 to disable limit
+            memory_limit (int): max memory allocated during sampled execution (bytes). 0 to disable limit (must be 0 if memory accounting is not available)
+            memory_sample_rate (float): ratio of executions sampled for memory accounting (0.0 to 1.0). None to keep current value
+
+        Raises:
+            InvalidParameter: if parameter is invalid
+        """
+        if cpu_limit is None or cpu_limit<0:
+            raise InvalidParameter(u'Cpu_limit parameter must be positive')
+        if memory_limit is None or memory_limit<0:
+            raise InvalidParameter(u'Memory_limit parameter must be positive')
+        if memory_limit>0 and not MemorySampler.is_available():
+            raise InvalidParameter(u'Memory accounting is not available on this system, memory_limit must be 0')
+        if memory_sample_rate is not None and (memory_sample_rate<0.0 or memory_sample_rate>1.0):
+            raise InvalidParameter(u'Memory_sample_rate parameter must be between 0.0 and 1.0')
+
+        #save config
+        self._set_config_field(u'cpu_limit', cpu_limit)
+        self._set_config_field(u'memory_limit', memory_limit)
+        if memory_sample_rate is not None:
+            self._set_config_field(u'memory_sample_rate', memory_sample_rate)
+
+        #update actions
+        for script in self.__scripts.keys():
+            self.__apply_resources_limits(self.__scripts[script])
+
+    def get_execution_history(self, script=None, since=None, limit=100):
+        """
+        Return scripts execution history, last recorded execution first
+
+        Args:
+            script (string): script name. None for all scripts
+            since (float): oldest execution timestamp. None for no time limit
+            limit (int): max number of executions to return
+
+        Returns:
+            list: list of executions (see ExecutionHistory.get)
+
+        Raises:
+            InvalidParameter: if parameter is invalid
+        """
+        if limit is None or limit<=0:
+            raise InvalidParameter(u'Limit parameter must be greater than 0')
+
+        return self.__history.get(script, since, limit)
+
+    def set_idle_timeout(self, idle_timeout):
+        """
+        Set idle duration after which script thread is released. Thread is started again on next event
+
+        Threads are never released by default: script variables kept between executions are lost when
+        thread is released (script starts again with empty namespace on next event). All events are sent
+        to all scripts, including time event sent every minute, so timeout must be lower than 60 seconds
+        for threads to be released between two time events.
+
+        Args:
+            idle_timeout (float): idle duration (seconds). 0 to never release threads
+
+        Raises:
+            InvalidParameter: if parameter is invalid
+        """
+        if idle_timeout is None or idle_timeout<0:
+            raise InvalidParameter(u'Idle_timeout parameter must be positive')
+
+        #save config
+        self._set_config_field(u'idle_timeout', idle_timeout)
+
+        #update running actions
+        idle_timeout = self.__get_idle_timeout()
+        for script in self.__scripts:
+            self.__scripts[script].set_idle_timeout(idle_timeout)
+
+    def set_command_rate_limits(self, rate, burst, global_rate, global_burst, blocking=True):
+        """
+        Set rate limits of commands sent by scripts to other modules
+
+        Args:
+            rate (float): max commands per second for each script. 0 to disable limit
+            burst (int): number of commands a script can send at once before being limited
+            global_rate (float): max commands per second for all scripts. 0 to disable limit
+            global_burst (int): number of commands all scripts can send at once before being limited
+            blocking (bool): True to delay limited commands, False to make them fail immediately
+
+        Raises:
+            InvalidParameter: if parameter is invalid
+        """
+        if rate is None or rate<0:
+            raise InvalidParameter(u'Rate parameter must be positive')
+        if burst is None or burst<1:
+            raise InvalidParameter(u'Burst parameter must be greater than 0')
+        if global_rate is None or global_rate<0:
+            raise InvalidParameter(u'Global_rate parameter must be positive')
+        if global_burst is None or global_burst<1:
+            raise InvalidParameter(u'Global_burst parameter must be greater than 0')
+
+        #save config
+        self._set_config_field(u'command_rate', rate)
+        self._set_config_field(u'command_burst', burst)
+        self._set_config_field(u'global_command_rate', global_rate)
+        self._set_config_field(u'global_command_burst', global_burst)
+        self._set_config_field(u'command_rate_blocking', bool(blocking))
+
+        #update actions
+        self.__global_command_bucket = self.__get_global_command_bucket()
+        for script in self.__scripts.keys():
+            self.__apply_command_rate_limits(self.__scripts[script])
+
     def disable_script(self, script, disabled):
         """
         Enable/disable specified script
@@ -299,6 +703,30 @@ class Actions(RaspIotModule):
         self._set_config_field(u'scripts', scripts)
         self.__scripts[script].set_disabled(disabled)
 
+    def disable_scripts(self, scripts, disabled):
+        """
+        Enable/disable specified scripts at once
+
+        Args:
+            scripts (list): list of script names
+            disabled (bool): disable flag
+
+        Raises:
+            InvalidParameter: if parameter is invalid
+        """
+        if scripts is None or len(scripts)==0:
+            raise InvalidParameter(u'Scripts parameter is missing')
+        for script in scripts:
+            if not self.__scripts.has_key(script):
+                raise InvalidParameter(u'Script "%s" not found' % script)
+
+        #enable/disable scripts
+        config = self._get_config_field(u'scripts')
+        for script in scripts:
+            config[script][u'disabled'] = disabled
+            self.__scripts[script].set_disabled(disabled)
+        self._set_config_field(u'scripts', config)
+
     def delete_script(self, script):
         """
         Delete specified script
@@ -306,16 +734,40 @@ class Actions(RaspIotModule):
         Args:
             script (string): script name
         """
-        for root, dirs, scripts in os.walk(Actions.SCRIPTS_PATH):
-            for script_ in scripts:
-                if script==script_:
-                    #script found, remove from filesystem
-                    os.remove(os.path.join(Actions.SCRIPTS_PATH, script))
-                    #force script loading
-                    self.__load_scripts()
-                    return True
+        path = os.path.join(Actions.SCRIPTS_PATH, script)
+        if os.path.basename(script)!=script or not os.path.isfile(path):
+            return False
+
+        #script found, remove from filesystem
+        self.cleep_filesystem.rm(path)
+        #force script loading
+        self.__load_scripts()
+        return True
+
+    def delete_scripts(self, scripts):
+        """
+        Delete specified scripts at once
 
-        return False
+        Args:
+            scripts (list): list of script names
+
+        Raises:
+            InvalidParameter: if parameter is invalid
+        """
+        if scripts is None or len(scripts)==0:
+            raise InvalidParameter(u'Scripts parameter is missing')
+        for script in scripts:
+            if not self.__scripts.has_key(script):
+                raise InvalidParameter(u'Script "%s" not found' % script)
+
+        #remove scripts from filesystem and reload them even if a removal fails
+        try:
+            for script in scripts:
+                path = self.__scripts[script].script
+                if os.path.isfile(path):
+                    self.cleep_filesystem.rm(path)
+        finally:
+            self.__load_scripts()
 
     def add_script(self, filepath):
         """
@@ -351,6 +803,68 @@ class Actions(RaspIotModule):
             self.logger.error(u'Script file "%s" doesn\'t exist' % filepath)
             raise Exception(u'Script file "%s"  doesn\'t exists' % filepath)
 
+    def add_scripts(self, filepath):
+        """
+        Add scripts stored in archive (zip or tar) using rpc upload. Existing scripts are overwritten
+
+        Args:
+            filepath (string): archive full path
+
+        Returns:
+            list: list of added scripts
+
+        Raises:
+            InvalidParameter: if invalid parameter is specified
+            Exception: if error occured
+        """
+        if not os.path.exists(filepath):
+            self.logger.error(u'Archive file "%s" doesn\'t exist' % filepath)
+            raise Exception(u'Archive file "%s" doesn\'t exist' % filepath)
+
+        try:
+            scripts = get_archive_scripts(filepath)
+        finally:
+            self.cleep_filesystem.rm(filepath)
+
+        #write scripts and reload them even if a write fails
+        try:
+            for name, content in scripts.items():
+                path = os.path.join(Actions.SCRIPTS_PATH, name)
+                self.cleep_filesystem.write_data(path, content, encoding='utf-8')
+            self.logger.info(u'%d scripts uploaded successfully' % len(scripts))
+        finally:
+            self.__load_scripts()
+
+        return scripts.keys()
+
+    def export_scripts(self):
+        """
+        Export all scripts in single zip archive. Archive is overwritten by next export
+
+        Returns:
+            dict: archive infos::
+
+                {
+                    filepath (string): archive full path
+                    filename (string): archive name
+                }
+
+        """
+        filename = u'actions.zip'
+        filepath = os.path.join(tempfile.gettempdir(), filename)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        with zipfile.ZipFile(filepath, u'w', zipfile.ZIP_DEFLATED) as archive:
+            for script in self.__scripts.keys():
+                path = self.__scripts[script].script
+                if os.path.exists(path):
+                    archive.write(path, script)
+
+        return {
+            u'filepath': filepath,
+            u'filename': filename,
+        }
+
     def download_script(self, filename):
         """
         Download specified action
@@ -394,7 +908,7 @@ class Actions(RaspIotModule):
             raise InvalidParameter(u'Script "%s" does not exist' % script)
         
         #TODO handle event
-        debug = Action(os.path.join(Actions.SCRIPTS_PATH, script), self.push, False, True)
+        debug = Action(os.path.join(Actions.SCRIPTS_PATH, script), self.push, False, True, emit_callback=self.__route_event)
         debug.start()
 
     def rename_script(self, old_script, new_script):
@@ -433,4 +947,167 @@ class Actions(RaspIotModule):
         #reload scripts
         self.__load_scripts()
 
-        
+    def __get_recording_path(self, filename):
+        """
+        Return recording full path
+
+        Args:
+            filename (string): recording filename
+
+        Returns:
+            string: recording full path
+
+        Raises:
+            InvalidParameter: if filename is invalid
+        """
+        if filename is None or len(filename)==0:
+            raise InvalidParameter(u'Filename parameter is missing')
+        if os.path.basename(filename)!=filename:
+            raise InvalidParameter(u'Filename parameter is invalid')
+
+        return os.path.join(Actions.RECORDINGS_PATH, filename)
+
+    def start_events_recording(self, filename=u'events.rec'):
+        """
+        Start recording received events into specified file (appended if already exists)
+
+        Args:
+            filename (string): recording filename
+
+        Raises:
+            InvalidParameter: if parameter is invalid
+            CommandError: if recording is already running
+        """
+        path = self.__get_recording_path(filename)
+        if self.__recorder:
+            raise CommandError(u'Events recording is already running')
+
+        if not os.path.exists(Actions.RECORDINGS_PATH):
+            self.cleep_filesystem.mkdir(Actions.RECORDINGS_PATH, True)
+
+        recorder = EventRecorder(self.cleep_filesystem, path)
+        recorder.start()
+        self.__recorder = recorder
+        self.logger.info(u'Events recording started to "%s"' % path)
+
+    def stop_events_recording(self):
+        """
+        Stop recording events
+
+        Returns:
+            bool: True if recording was running
+        """
+        if not self.__recorder:
+            return False
+
+        recorder = self.__recorder
+        self.__recorder = None
+        recorder.stop()
+        self.logger.info(u'Events recording stopped')
+
+        return True
+
+    def replay_events(self, filename, speed=0.0):
+        """
+        Replay recorded events against current scripts using stubbed bus (commands are not sent to other modules)
+        Replay runs in background: actions.replay.end event is sent with report when it ends, and
+        report is also available using get_replay_status command
+
+        Args:
+            filename (string): recording filename
+            speed (float): replay speed factor (1.0 for real speed). 0 to replay as fast as possible
+
+        Raises:
+            InvalidParameter: if parameter is invalid
+            CommandError: if replay is already running
+        """
+        path = self.__get_recording_path(filename)
+        if not os.path.exists(path):
+            raise InvalidParameter(u'Recording "%s" does not exist' % filename)
+        if speed is None or speed<0:
+            raise InvalidParameter(u'Speed parameter must be positive')
+        if self.__replayer:
+            raise CommandError(u'Replay is already running')
+
+        config = self._get_config_field(u'scripts')
+        scripts = {}
+        for script in self.__scripts:
+            scripts[script] = {
+                u'path': self.__scripts[script].script,
+                u'disabled': config[script][u'disabled'] if script in config else False
+            }
+
+        self.__replayer = EventReplayer(scripts)
+        self.__replay_status = {
+            u'running': True,
+            u'filename': filename,
+            u'report': None,
+            u'error': None
+        }
+        replay = Thread(target=self.__replay, args=(path, speed), name=u'actions_replay')
+        replay.daemon = True
+        replay.start()
+
+    def __replay(self, path, speed):
+        """
+        Replay thread
+
+        Args:
+            path (string): recording path
+            speed (float): replay speed factor
+        """
+        report = None
+        error = None
+        try:
+            report = self.__replayer.replay(path, speed)
+        except Exception as e:
+            self.logger.exception(u'Error during events replay')
+            error = unicode(e)
+
+        self.__replay_status.update({
+            u'running': False,
+            u'report': report,
+            u'error': error
+        })
+        self.__replayer = None
+
+        #send end event
+        request = MessageRequest()
+        request.event = u'actions.replay.end'
+        request.params = self.get_replay_status()
+        try:
+            self.push(request)
+        except:
+            self.logger.exception(u'Unable to send replay end event')
+
+    def get_replay_status(self):
+        """
+        Return status of current or last replay
+
+        Returns:
+            dict: replay status::
+
+                {
+                    running (bool): True if replay is running
+                    filename (string): replayed recording
+                    report (dict): replay report when replay is terminated (see EventReplayer.replay)
+                    error (string): error message if replay failed
+                }
+
+        """
+        return self.__replay_status.copy()
+
+    def stop_replay(self):
+        """
+        Stop running replay. Report will contain events replayed so far
+
+        Returns:
+            bool: True if replay was running
+        """
+        replayer = self.__replayer
+        if not replayer:
+            return False
+
+        replayer.stop()
+        return True
+
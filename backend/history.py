@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import io
+import json
+import logging
+from array import array
+from threading import Lock
+
+__all__ = ['ExecutionHistory']
+
+class HistoryIndex():
+    """
+    In-memory index of history file: timestamps and file offsets of records in write order, globally and by script
+    Arrays are used to keep memory footprint low on small devices
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.clear()
+
+    def clear(self):
+        """
+        Clear index
+        """
+        self.entries = {None: (array('d'), array('L'))}
+
+    def add(self, script, timestamp, offset):
+        """
+        Add record to index
+
+        Args:
+            script (string): script name
+            timestamp (float): record timestamp
+            offset (int): record offset in file
+        """
+        for key in (None, script):
+            if key not in self.entries:
+                self.entries[key] = (array('d'), array('L'))
+            (timestamps, offsets) = self.entries[key]
+            timestamps.append(timestamp)
+            offsets.append(offset)
+
+    def search(self, script, since, limit):
+        """
+        Search records offsets, last written first
+
+        Timestamps are not ordered (records are written when execution ends and system clock can be
+        adjusted), so entries are walked back from last written one until limit is reached.
+
+        Args:
+            script (string): script name or None for all scripts
+            since (float): oldest record timestamp or None
+            limit (int): max number of offsets to return
+
+        Returns:
+            list: list of offsets
+        """
+        if script not in self.entries:
+            return []
+
+        (timestamps, offsets) = self.entries[script]
+        found = []
+        for index in range(len(offsets)-1, -1, -1):
+            if len(found)>=limit:
+                break
+            if since is None or timestamps[index]>=since:
+                found.append(offsets[index])
+
+        return found
+
+
+
+
+class ExecutionHistory():
+    """
+    Append-only history of scripts executions stored as json lines
+    Records are buffered in memory and written by block to spare SD card. When file reaches max size,
+    it is rotated and only one previous file is kept, so history never exceeds twice max size on disk.
+    """
+
+    MAX_SIZE = 524288
+    FLUSH_COUNT = 50
+    FLUSH_INTERVAL = 300.0
+
+    def __init__(self, cleep_filesystem, path, max_size=MAX_SIZE, flush_count=FLUSH_COUNT):
+        """
+        Constructor
+
+        Args:
+            cleep_filesystem (CleepFilesystem): filesystem instance
+            path (string): history file path
+            max_size (int): max history file size before rotation (bytes)
+            flush_count (int): number of buffered records that triggers flush
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.cleep_filesystem = cleep_filesystem
+        self.path = path
+        self.old_path = u'%s.1' % path
+        self.max_size = max_size
+        self.flush_count = flush_count
+        self.__buffer = []
+        self.__size = 0
+        self.__missing_newline = False
+        self.__index = HistoryIndex()
+        self.__old_index = HistoryIndex()
+        self.__lock = Lock()
+
+    def __build_index(self, path, index):
+        """
+        Build index scanning specified history file line by line
+
+        Args:
+            path (string): history file path
+            index (HistoryIndex): index to fill
+
+        Returns:
+            tuple: file size and flag set if last line is truncated
+        """
+        index.clear()
+        if not os.path.exists(path):
+            return (0, False)
+
+        offset = 0
+        line = b''
+        with io.open(path, u'rb') as fd:
+            for line in fd:
+                try:
+                    record = json.loads(line.decode(u'utf-8'))
+                    index.add(record[u's'], record[u't'], offset)
+                except:
+                    self.logger.debug(u'Drop invalid history record at offset %d of "%s"' % (offset, path))
+                offset += len(line)
+
+        return (offset, len(line)>0 and not line.endswith(b'\n'))
+
+    def load(self):
+        """
+        Load history indexes
+        """
+        self.__lock.acquire()
+        try:
+            self.__build_index(self.old_path, self.__old_index)
+            (self.__size, self.__missing_newline) = self.__build_index(self.path, self.__index)
+        finally:
+            self.__lock.release()
+
+    def add(self, script, event, timestamp, duration, error=None):
+        """
+        Add execution record
+
+        Args:
+            script (string): script name
+            event (string): event name that triggered execution
+            timestamp (float): execution start timestamp
+            duration (float): execution duration (seconds)
+            error (string): error summary if execution failed
+        """
+        record = {
+            u't': timestamp,
+            u's': script,
+            u'e': event,
+            u'd': round(duration, 4),
+            u'o': u'error' if error else u'success',
+            u'r': error,
+        }
+
+        self.__lock.acquire()
+        try:
+            self.__buffer.append(record)
+            if len(self.__buffer)>=self.flush_count:
+                self.__flush()
+        except:
+            self.logger.exception(u'Unable to write execution history')
+        finally:
+            self.__lock.release()
+
+    def flush(self):
+        """
+        Write buffered records to history file
+        """
+        self.__lock.acquire()
+        try:
+            self.__flush()
+        except:
+            self.logger.exception(u'Unable to write execution history')
+        finally:
+            self.__lock.release()
+
+    def __flush(self):
+        """
+        Write buffered records to history file. Lock must be acquired
+        """
+        if len(self.__buffer)==0:
+            return
+
+        if self.__size>=self.max_size:
+            self.__rotate()
+
+        records = self.__buffer
+        self.__buffer = []
+        fd = self.cleep_filesystem.open(self.path, u'ab')
+        try:
+            if self.__missing_newline:
+                fd.write(b'\n')
+                self.__size += 1
+                self.__missing_newline = False
+            for record in records:
+                line = json.dumps(record, separators=(',', ':')).encode(u'utf-8') + b'\n'
+                fd.write(line)
+                self.__index.add(record[u's'], record[u't'], self.__size)
+                self.__size += len(line)
+        finally:
+            self.cleep_filesystem.close(fd)
+
+    def __rotate(self):
+        """
+        Rotate history file. Lock must be acquired
+        """
+        self.cleep_filesystem.move(self.path, self.old_path)
+        (self.__old_index, self.__index) = (self.__index, self.__old_index)
+        self.__index.clear()
+        self.__size = 0
+
+    def __read_records(self, path, offsets):
+        """
+        Read records at specified offsets
+
+        Args:
+            path (string): history file path
+            offsets (list): records offsets
+
+        Returns:
+            list: list of records
+        """
+        records = []
+        if len(offsets)==0 or not os.path.exists(path):
+            return records
+
+        with io.open(path, u'rb') as fd:
+            for offset in offsets:
+                fd.seek(offset)
+                record = json.loads(fd.readline().decode(u'utf-8'))
+                records.append({
+                    u'timestamp': record[u't'],
+                    u'script': record[u's'],
+                    u'event': record[u'e'],
+                    u'duration': record[u'd'],
+                    u'outcome': record[u'o'],
+                    u'error': record[u'r'],
+                })
+
+        return records
+
+    def get(self, script=None, since=None, limit=100):
+        """
+        Return execution records, last recorded first
+
+        Args:
+            script (string): script name. None for all scripts
+            since (float): oldest record timestamp. None for no time limit
+            limit (int): max number of records
+
+        Returns:
+            list: list of records::
+
+                [
+                    {
+                        timestamp (float): execution start timestamp
+                        script (string): script name
+                        event (string): event name
+                        duration (float): execution duration (seconds)
+                        outcome (string): success or error
+                        error (string): error summary or None
+                    },
+                    ...
+                ]
+
+        """
+        self.__lock.acquire()
+        try:
+            self.__flush()
+            offsets = self.__index.search(script, since, limit)
+            records = self.__read_records(self.path, offsets)
+            if len(records)<limit:
+                offsets = self.__old_index.search(script, since, limit-len(records))
+                records += self.__read_records(self.old_path, offsets)
+        finally:
+            self.__lock.release()
+
+        return records
+
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Lock
+
+__all__ = ['TokenBucket']
+
+class TokenBucket():
+    """
+    Token bucket rate limiter
+    Bucket is refilled with rate tokens per second up to burst tokens. Each call consumes one token.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Constructor
+
+        Args:
+            rate (float): number of tokens added per second
+            burst (int): max number of tokens in bucket
+        """
+        self.rate = float(rate)
+        self.burst = float(max(burst, 1))
+        self.__tokens = self.burst
+        self.__last = time.time()
+        self.__lock = Lock()
+
+    def __refill(self):
+        """
+        Add tokens generated since last refill. Lock must be acquired
+        """
+        now = time.time()
+        self.__tokens = min(self.burst, self.__tokens + (now - self.__last) * self.rate)
+        self.__last = now
+
+    def consume(self):
+        """
+        Consume one token if available
+
+        Returns:
+            float: 0.0 if token was consumed, otherwise delay before next token is available (seconds)
+        """
+        self.__lock.acquire()
+        try:
+            self.__refill()
+            if self.__tokens>=1.0:
+                self.__tokens -= 1.0
+                return 0.0
+
+            return (1.0 - self.__tokens) / self.rate
+        finally:
+            self.__lock.release()
+
+    def refund(self):
+        """
+        Give back previously consumed token
+        """
+        self.__lock.acquire()
+        try:
+            self.__tokens = min(self.burst, self.__tokens + 1.0)
+        finally:
+            self.__lock.release()
+
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import io
+import json
+import logging
+import time
+from threading import Lock, Event
+from raspiot.utils import MessageResponse
+from action import Action
+
+__all__ = ['EventRecorder', 'EventReplayer', 'read_records']
+
+def read_records(path):
+    """
+    Read records from specified recording file
+
+    Each record is stored on a single line prefixed by its length: "<length> <json>\\n"
+    Malformed or truncated records (ie unexpected power loss) are dropped.
+
+    Args:
+        path (string): recording file path
+
+    Returns:
+        generator: records (timestamp, event)
+    """
+    with io.open(path, u'rb') as fd:
+        for line in fd:
+            try:
+                (length, data) = line.rstrip(b'\n').split(b' ', 1)
+                if int(length)!=len(data):
+                    continue
+                record = json.loads(data.decode(u'utf-8'))
+                yield (record[u't'], record[u'e'])
+            except:
+                continue
+
+
+
+
+class EventRecorder():
+    """
+    Record events received by actions module into compact append-only file
+    File is rotated when it reaches MAX_SIZE bytes, MAX_FILES previous files are kept (suffixed by .1, .2...)
+    """
+
+    MAX_SIZE = 1048576
+    MAX_FILES = 3
+
+    def __init__(self, cleep_filesystem, path, max_size=MAX_SIZE, max_files=MAX_FILES):
+        """
+        Constructor
+
+        Args:
+            cleep_filesystem (CleepFilesystem): filesystem instance
+            path (string): recording file path
+            max_size (int): max recording file size before rotation (bytes)
+            max_files (int): number of rotated files to keep
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.cleep_filesystem = cleep_filesystem
+        self.path = path
+        self.max_size = max_size
+        self.max_files = max_files
+        self.__fd = None
+        self.__size = 0
+        self.__lock = Lock()
+
+    def is_recording(self):
+        """
+        Return recording status
+
+        Returns:
+            bool: True if recorder is running
+        """
+        return self.__fd is not None
+
+    def start(self):
+        """
+        Open recording file
+        """
+        self.__lock.acquire()
+        try:
+            if self.__fd is None:
+                self.__open()
+        finally:
+            self.__lock.release()
+
+    def stop(self):
+        """
+        Flush and close recording file
+        """
+        self.__lock.acquire()
+        try:
+            self.__close()
+        finally:
+            self.__lock.release()
+
+    def __open(self):
+        """
+        Open recording file in append mode
+        """
+        self.__size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.__fd = self.cleep_filesystem.open(self.path, u'ab')
+
+    def __close(self):
+        """
+        Close recording file
+        """
+        if self.__fd is not None:
+            self.cleep_filesystem.close(self.__fd)
+            self.__fd = None
+
+    def __rotate(self):
+        """
+        Rotate recording files
+        """
+        self.__close()
+        for index in range(self.max_files-1, 0, -1):
+            src = u'%s.%d' % (self.path, index)
+            if os.path.exists(src):
+                self.cleep_filesystem.move(src, u'%s.%d' % (self.path, index+1))
+        if self.max_files>0:
+            self.cleep_filesystem.move(self.path, u'%s.1' % self.path)
+        else:
+            self.cleep_filesystem.rm(self.path)
+        self.__open()
+
+    def record(self, event):
+        """
+        Append event to recording file
+
+        Args:
+            event (dict): event as received by actions module
+        """
+        if self.__fd is None:
+            return
+
+        #recording must never prevent event from being processed by scripts
+        try:
+            data = json.dumps({u't': time.time(), u'e': event}, separators=(',', ':'), default=repr).encode(u'utf-8')
+        except:
+            self.logger.warning(u'Unable to record unserializable event %s' % repr(event))
+            return
+        line = b'%d %s\n' % (len(data), data)
+
+        self.__lock.acquire()
+        try:
+            if self.__fd is None:
+                return
+            if self.__size>0 and self.__size+len(line)>self.max_size:
+                self.__rotate()
+            self.__fd.write(line)
+            self.__size += len(line)
+        except:
+            self.logger.exception(u'Unable to record event')
+        finally:
+            self.__lock.release()
+
+
+
+
+class EventReplayer():
+    """
+    Replay recorded events against action scripts using stubbed message bus
+    Commands sent by scripts are never forwarded to real modules, they always receive empty response
+    """
+
+    def __init__(self, scripts):
+        """
+        Constructor
+
+        Args:
+            scripts (dict): scripts to replay events on::
+
+                {
+                    script name (string): {
+                        path (string): script full path
+                        disabled (bool): script disabled status
+                    },
+                    ...
+                }
+
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.scripts = scripts
+        self.__stop_event = Event()
+
+    def stop(self):
+        """
+        Abort running replay. Report contains events replayed so far
+        """
+        self.__stop_event.set()
+
+    def __get_bus_stub(self, counters, script):
+        """
+        Return stubbed bus push function
+
+        Args:
+            counters (dict): commands counters
+            script (string): script name
+
+        Returns:
+            function: bus push function
+        """
+        def bus_push(request):
+            counters[script] += 1
+            return MessageResponse()
+
+        return bus_push
+
+    def __get_emit_router(self, actions):
+        """
+        Return function routing events emitted by scripts to other replayed actions
+        Forwarded events are routed the same way, as if they came back from message bus
+
+        Args:
+            actions (dict): replayed actions
+
+        Returns:
+            function: emit callback
+        """
+        def route_event(event, forward):
+            for script, action in actions.items():
+                if script not in event[u'chain']:
+                    action.push_event(event)
+
+        return route_event
+
+    def replay(self, path, speed=1.0, timeout=60.0):
+        """
+        Replay recording
+
+        Args:
+            path (string): recording file path
+            speed (float): replay speed factor (1.0 for real speed, 2.0 twice faster...). 0 to replay as fast as possible
+            timeout (float): max time to wait for scripts to process all events after last replayed one (seconds)
+
+        Returns:
+            dict: replay report::
+
+                {
+                    events (int): number of replayed events
+                    duration (float): replay duration (seconds)
+                    scripts (dict): per script report::
+
+                        {
+                            script name (string): {
+                                events (int): number of processed recorded events
+                                chained (int): number of processed events emitted by other scripts
+                                executions (int): number of executions
+                                errors (int): number of failed executions
+                                commands (int): number of commands sent to bus
+                                throughput (float): executions per second
+                                avgduration (float): average execution duration (seconds)
+                                maxduration (float): longest execution duration (seconds)
+                                avglatency (float): average latency between event push and end of execution (seconds)
+                                maxlatency (float): longest latency (seconds)
+                            },
+                            ...
+                        }
+
+                }
+
+        """
+        #create dedicated actions (threads are started on first event)
+        counters = {}
+        actions = {}
+        route_event = self.__get_emit_router(actions)
+        for script, infos in self.scripts.items():
+            counters[script] = 0
+            actions[script] = Action(infos[u'path'], self.__get_bus_stub(counters, script), infos[u'disabled'], emit_callback=route_event)
+
+        #feed actions
+        count = 0
+        start = time.time()
+        first_timestamp = None
+        try:
+            for (timestamp, event) in read_records(path):
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                if speed>0:
+                    delay = (timestamp - first_timestamp) / speed - (time.time() - start)
+                    if delay>0 and self.__stop_event.wait(delay):
+                        break
+                if self.__stop_event.is_set():
+                    break
+                for action in actions.values():
+                    action.push_event(event)
+                count += 1
+
+            #wait for end of processing
+            end_limit = time.time() + timeout
+            while time.time()<end_limit and not self.__stop_event.is_set():
+                stats = [action.get_execution_stats() for action in actions.values()]
+                if all([stat[u'events']+stat[u'dropped']>=count for stat in stats]):
+                    break
+                self.__stop_event.wait(0.1)
+            duration = time.time() - start
+
+        finally:
+            for action in actions.values():
+                action.stop()
+
+        #build report
+        report = {
+            u'events': count,
+            u'duration': duration,
+            u'scripts': {}
+        }
+        for script, action in actions.items():
+            stats = action.get_execution_stats()
+            executions = stats[u'executions']
+            report[u'scripts'][script] = {
+                u'events': stats[u'events'] + stats[u'dropped'],
+                u'chained': stats[u'chained'],
+                u'executions': executions,
+                u'errors': stats[u'errors'],
+                u'commands': counters[script],
+                u'throughput': float(executions) / duration if duration>0 else 0.0,
+                u'avgduration': stats[u'duration'] / executions if executions>0 else 0.0,
+                u'maxduration': stats[u'maxduration'],
+                u'avglatency': stats[u'latency'] / executions if executions>0 else 0.0,
+                u'maxlatency': stats[u'maxlatency'],
+            }
+
+        return report
+
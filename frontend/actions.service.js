@@ -33,6 +33,34 @@ var actionsService = function($q, $rootScope, rpcService) {
         return rpcService.upload('add_script', 'actions', file);
     };
 
+    /**
+     * Upload scripts archive
+     */
+    self.uploadScripts = function(file) {
+        return rpcService.upload('add_scripts', 'actions', file);
+    };
+
+    /**
+     * Export all scripts
+     */
+    self.exportScripts = function() {
+        rpcService.download('export_scripts', 'actions');
+    };
+
+    /**
+     * Disable scripts
+     */
+    self.disableScripts = function(scripts, disabled) {
+        return rpcService.sendCommand('disable_scripts', 'actions', {'scripts':scripts, 'disabled':disabled});
+    };
+
+    /**
+     * Delete scripts
+     */
+    self.deleteScripts = function(scripts) {
+        return rpcService.sendCommand('delete_scripts', 'actions', {'scripts':scripts});
+    };
+
     /**
      * Load script
      */
@@ -61,6 +89,69 @@ var actionsService = function($q, $rootScope, rpcService) {
         return rpcService.sendCommand('rename_script', 'actions', {'old_script':oldScript, 'new_script':newScript});
     };
 
+    /**
+     * Get execution history
+     */
+    self.getExecutionHistory = function(script, since, limit) {
+        return rpcService.sendCommand('get_execution_history', 'actions', {'script':script, 'since':since, 'limit':limit});
+    };
+
+    /**
+     * Set idle timeout
+     */
+    self.setIdleTimeout = function(idleTimeout) {
+        return rpcService.sendCommand('set_idle_timeout', 'actions', {'idle_timeout':idleTimeout});
+    };
+
+    /**
+     * Set resources limits
+     */
+    self.setResourcesLimits = function(cpuLimit, memoryLimit, memorySampleRate) {
+        return rpcService.sendCommand('set_resources_limits', 'actions', {'cpu_limit':cpuLimit, 'memory_limit':memoryLimit, 'memory_sample_rate':memorySampleRate});
+    };
+
+    /**
+     * Set commands rate limits
+     */
+    self.setCommandRateLimits = function(rate, burst, globalRate, globalBurst, blocking) {
+        return rpcService.sendCommand('set_command_rate_limits', 'actions', {'rate':rate, 'burst':burst, 'global_rate':globalRate, 'global_burst':globalBurst, 'blocking':blocking});
+    };
+
+    /**
+     * Start events recording
+     */
+    self.startEventsRecording = function(filename) {
+        return rpcService.sendCommand('start_events_recording', 'actions', {'filename':filename});
+    };
+
+    /**
+     * Stop events recording
+     */
+    self.stopEventsRecording = function() {
+        return rpcService.sendCommand('stop_events_recording', 'actions');
+    };
+
+    /**
+     * Replay recorded events
+     */
+    self.replayEvents = function(filename, speed) {
+        return rpcService.sendCommand('replay_events', 'actions', {'filename':filename, 'speed':speed});
+    };
+
+    /**
+     * Get replay status
+     */
+    self.getReplayStatus = function() {
+        return rpcService.sendCommand('get_replay_status', 'actions');
+    };
+
+    /**
+     * Stop replay
+     */
+    self.stopReplay = function() {
+        return rpcService.sendCommand('stop_replay', 'actions');
+    };
+
 };
     
 var RaspIot = angular.module('RaspIot');
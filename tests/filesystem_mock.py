@@ -0,0 +1,20 @@
+import os
+import io
+
+class FilesystemMock():
+    """
+    Cleep filesystem mock working on real files (no read-only filesystem handling)
+    """
+
+    def open(self, path, mode):
+        return io.open(path, mode)
+
+    def close(self, fd):
+        fd.close()
+
+    def move(self, src, dst):
+        os.rename(src, dst)
+
+    def rm(self, path):
+        os.remove(path)
+
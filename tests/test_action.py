@@ -0,0 +1,312 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.action import Action, thread_cpu_time
+from backend.recorder import EventReplayer
+from raspiot.utils import MessageResponse
+import os
+import io
+import json
+import time
+import shutil
+import tempfile
+from mock import patch, Mock
+
+class TestActionThread(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=logging.CRITICAL)
+        self.path = tempfile.mkdtemp()
+        self.executions = []
+        self.actions = []
+
+    def tearDown(self):
+        for action in self.actions:
+            action.stop()
+        shutil.rmtree(self.path)
+
+    def __write_script(self, name, code):
+        path = os.path.join(self.path, name)
+        with io.open(path, u'w') as fd:
+            fd.write(code)
+        return path
+
+    def __execution_callback(self, script, event, timestamp, duration, error):
+        self.executions.append((script, event, error))
+
+    def __get_action(self, disabled=False, idle_timeout=None):
+        path = self.__write_script(u'script.py', u'logger.debug(event)\n')
+        action = Action(path, lambda request: MessageResponse(), disabled, idle_timeout=idle_timeout, execution_callback=self.__execution_callback)
+        self.actions.append(action)
+        return action
+
+    def __wait(self, condition, timeout=5.0):
+        end = time.time() + timeout
+        while not condition() and time.time()<end:
+            time.sleep(0.05)
+
+    def test_thread_is_started_lazily(self):
+        action = self.__get_action()
+        self.assertFalse(action.is_alive())
+
+        action.push_event({u'event': u'test.event', u'params': {}})
+        self.assertTrue(action.is_alive())
+        self.__wait(lambda: len(self.executions)==1)
+        self.assertEqual(len(self.executions), 1)
+
+    def test_thread_is_never_released_without_idle_timeout(self):
+        action = self.__get_action()
+        action.push_event({u'event': u'test.event', u'params': {}})
+        self.__wait(lambda: len(self.executions)==1)
+        time.sleep(0.6)
+
+        self.assertTrue(action.is_alive())
+
+    def test_thread_is_released_when_idle(self):
+        action = self.__get_action(idle_timeout=0.1)
+        action.push_event({u'event': u'test.first', u'params': {}})
+        self.__wait(lambda: not action.is_alive())
+        self.assertFalse(action.is_alive())
+        self.assertEqual(len(self.executions), 1)
+
+        #thread is started again on next event
+        action.push_event({u'event': u'test.second', u'params': {}})
+        self.__wait(lambda: len(self.executions)==2)
+        self.assertEqual([execution[1] for execution in self.executions], [u'test.first', u'test.second'])
+
+    def test_hibernate_keeps_thread_if_event_is_pending(self):
+        action = self.__get_action()
+        action._Action__events.appendleft(({u'event': u'test.event', u'params': {}}, time.time()))
+
+        self.assertFalse(action._Action__hibernate())
+
+    def test_no_event_lost_while_hibernating(self):
+        #thread is released as soon as queue is empty, events pushed meanwhile must restart it
+        action = self.__get_action(idle_timeout=0.0)
+        for i in range(20):
+            action.push_event({u'event': u'test.event%d' % i, u'params': {}})
+            time.sleep(0.01 * (i%3))
+        self.__wait(lambda: len(self.executions)==20)
+
+        self.assertEqual([execution[1] for execution in self.executions], [u'test.event%d' % i for i in range(20)])
+
+    def test_disabled_action_never_starts(self):
+        action = self.__get_action(disabled=True)
+        action.push_event({u'event': u'test.event', u'params': {}})
+
+        self.assertFalse(action.is_alive())
+        self.assertEqual(action.get_execution_stats()[u'dropped'], 1)
+        self.assertEqual(len(self.executions), 0)
+
+    def test_stopped_action_never_starts(self):
+        action = self.__get_action()
+        action.stop()
+        action.push_event({u'event': u'test.event', u'params': {}})
+
+        self.assertFalse(action.is_alive())
+
+
+
+
+class TestActionResources(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=logging.CRITICAL)
+        self.path = tempfile.mkdtemp()
+        self.executions = []
+        self.limits = []
+        self.actions = []
+
+    def tearDown(self):
+        for action in self.actions:
+            action.stop()
+        shutil.rmtree(self.path)
+
+    def __execution_callback(self, script, event, timestamp, duration, error):
+        self.executions.append((script, event, error))
+
+    def __limit_callback(self, script, reason):
+        self.limits.append((script, reason))
+
+    def __get_action(self):
+        path = os.path.join(self.path, u'script.py')
+        with io.open(path, u'w') as fd:
+            fd.write(u'logger.debug(event)\n')
+        action = Action(path, lambda request: MessageResponse(), False, limit_callback=self.__limit_callback, execution_callback=self.__execution_callback)
+        self.actions.append(action)
+        return action
+
+    def __wait(self, condition, timeout=5.0):
+        end = time.time() + timeout
+        while not condition() and time.time()<end:
+            time.sleep(0.05)
+
+    def __run_events(self, action, count):
+        for i in range(count):
+            action.push_event({u'event': u'test.event', u'params': {}})
+        self.__wait(lambda: len(self.executions)==count)
+
+    @patch(u'backend.action.thread_cpu_time')
+    def test_cpu_accounting(self, thread_cpu_time_mock):
+        thread_cpu_time_mock.side_effect = [10.0, 10.3, 10.5, 10.6]
+        action = self.__get_action()
+        self.__run_events(action, 2)
+
+        usage = action.get_resources_usage()
+        self.assertAlmostEqual(usage[u'cputime'], 0.4)
+        self.assertAlmostEqual(usage[u'avgcputime'], 0.2)
+        self.assertAlmostEqual(usage[u'maxcputime'], 0.3)
+        self.assertIsNone(usage[u'avgmemory'])
+        self.assertIsNone(usage[u'maxmemory'])
+
+    @patch(u'backend.action.MemorySampler')
+    @patch(u'backend.action.tracemalloc')
+    def test_memory_accounting(self, tracemalloc_mock, sampler_mock):
+        sampler_mock.return_value.stop.side_effect = [1000, 3000]
+        action = self.__get_action()
+        action.set_resources_limits(None, None, 1.0)
+        self.__run_events(action, 2)
+
+        usage = action.get_resources_usage()
+        self.assertEqual(usage[u'avgmemory'], 2000)
+        self.assertEqual(usage[u'maxmemory'], 3000)
+        self.assertEqual(action.get_execution_stats()[u'samples'], 2)
+
+    @patch(u'backend.action.thread_cpu_time')
+    def test_cpu_limit_exceeded(self, thread_cpu_time_mock):
+        thread_cpu_time_mock.side_effect = [0.0, 0.5, 1.0, 3.0]
+        action = self.__get_action()
+        action.set_resources_limits(1.0, None, 0.0)
+        self.__run_events(action, 2)
+        self.__wait(lambda: len(self.limits)>0)
+
+        self.assertEqual(len(self.limits), 1)
+        self.assertEqual(self.limits[0][0], u'script.py')
+        self.assertIn(u'cpu time', self.limits[0][1])
+
+    @patch(u'backend.action.MemorySampler')
+    @patch(u'backend.action.tracemalloc')
+    def test_memory_limit_exceeded(self, tracemalloc_mock, sampler_mock):
+        sampler_mock.return_value.stop.return_value = 2048
+        action = self.__get_action()
+        action.set_resources_limits(None, 1024, 1.0)
+        self.__run_events(action, 1)
+        self.__wait(lambda: len(self.limits)>0)
+
+        self.assertEqual(len(self.limits), 1)
+        self.assertIn(u'allocated memory', self.limits[0][1])
+
+    @patch(u'backend.action.time.clock', Mock(return_value=12.0))
+    @patch(u'backend.action.resource.getrusage', Mock(side_effect=ValueError(u'invalid who parameter')))
+    def test_thread_cpu_time_fallback(self):
+        self.assertEqual(thread_cpu_time(), 12.0)
+
+
+
+
+class TestActionEmit(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=logging.CRITICAL)
+        self.path = tempfile.mkdtemp()
+        self.emitted = []
+        self.executions = []
+        self.actions = []
+
+    def tearDown(self):
+        for action in self.actions:
+            action.stop()
+        shutil.rmtree(self.path)
+
+    def __write_script(self, name, code):
+        path = os.path.join(self.path, name)
+        with io.open(path, u'w') as fd:
+            fd.write(code)
+        return path
+
+    def __emit_callback(self, event, forward):
+        self.emitted.append((event, forward))
+
+    def __execution_callback(self, script, event, timestamp, duration, error):
+        self.executions.append((script, event, error))
+
+    def __get_action(self, path):
+        action = Action(path, lambda request: MessageResponse(), False, emit_callback=self.__emit_callback, execution_callback=self.__execution_callback)
+        self.actions.append(action)
+        return action
+
+    def __wait_executions(self, count, timeout=5.0):
+        end = time.time() + timeout
+        while len(self.executions)<count and time.time()<end:
+            time.sleep(0.05)
+
+    def test_emit_chain(self):
+        action = self.__get_action(self.__write_script(u'first.py', u'emit("test.step", {"value": 1})\n'))
+        action.push_event({u'event': u'test.start', u'params': {}})
+        self.__wait_executions(1)
+
+        self.assertEqual(len(self.emitted), 1)
+        (event, forward) = self.emitted[0]
+        self.assertEqual(event[u'event'], u'test.step')
+        self.assertEqual(event[u'params'], {u'value': 1})
+        self.assertEqual(event[u'chain'], [u'first.py'])
+        self.assertFalse(forward)
+
+    def test_emit_extends_chain(self):
+        action = self.__get_action(self.__write_script(u'second.py', u'emit("test.step")\n'))
+        action.push_event({u'event': u'test.step', u'params': {}, u'chain': [u'first.py']})
+        self.__wait_executions(1)
+
+        self.assertEqual(self.emitted[0][0][u'chain'], [u'first.py', u'second.py'])
+        self.assertEqual(self.emitted[0][0][u'params'], {})
+        self.assertEqual(action.get_execution_stats()[u'chained'], 1)
+        self.assertEqual(action.get_execution_stats()[u'events'], 0)
+
+    def test_emit_max_depth(self):
+        action = self.__get_action(self.__write_script(u'deep.py', u'emit("test.step")\n'))
+        chain = [u'script%d.py' % i for i in range(Action.EMIT_MAX_DEPTH)]
+        action.push_event({u'event': u'test.step', u'params': {}, u'chain': chain})
+        self.__wait_executions(1)
+
+        self.assertEqual(len(self.emitted), 0)
+        self.assertIn(u'Max emit depth reached', self.executions[0][2])
+
+    def test_emit_forward_is_rate_limited(self):
+        action = self.__get_action(self.__write_script(u'forward.py', u'emit("test.step", forward=True)\nemit("test.step", forward=True)\n'))
+        action.set_command_rate_limits(1.0, 1, None, False)
+        action.push_event({u'event': u'test.start', u'params': {}})
+        self.__wait_executions(1)
+
+        self.assertEqual(len(self.emitted), 1)
+        self.assertTrue(self.emitted[0][1])
+        self.assertEqual(self.emitted[0][0][u'chain'], [u'forward.py'])
+        self.assertIn(u'rate limit', self.executions[0][2])
+        status = action.get_execution_status()
+        self.assertEqual(status[u'commands'], 1)
+        self.assertEqual(status[u'rejected'], 1)
+
+    def test_emit_cycle_is_not_replayed(self):
+        first = self.__write_script(u'first.py', u'if event=="test.start":\n    emit("test.step")\n')
+        second = self.__write_script(u'second.py', u'if event=="test.step":\n    emit("test.step")\n')
+        recording = os.path.join(self.path, u'events.rec')
+        with io.open(recording, u'wb') as fd:
+            for i in range(2):
+                data = json.dumps({u't': float(i), u'e': {u'event': u'test.start', u'params': {}}}).encode(u'utf-8')
+                fd.write(b'%d %s\n' % (len(data), data))
+
+        replayer = EventReplayer({
+            u'first.py': {u'path': first, u'disabled': False},
+            u'second.py': {u'path': second, u'disabled': False},
+        })
+        report = replayer.replay(recording, speed=0, timeout=5.0)
+
+        self.assertEqual(report[u'events'], 2)
+        #first.py never receives events it led to, second.py emitted events are received by nobody
+        self.assertEqual(report[u'scripts'][u'first.py'][u'chained'], 0)
+        self.assertEqual(report[u'scripts'][u'first.py'][u'events'], 2)
+        self.assertEqual(report[u'scripts'][u'second.py'][u'events'], 2)
+
+if __name__ == "__main__":
+    unittest.main()
+
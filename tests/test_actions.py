@@ -2,22 +2,313 @@ import unittest
 import logging
 import sys
 sys.path.append('../')
-from backend.actions import Actions
+from backend.actions import Actions, get_archive_scripts
 from raspiot.utils import InvalidParameter, MissingParameter, CommandError, Unauthorized
 from raspiot.libs.tests import session
 import os
+import io
 import time
-from mock import Mock
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import threading
+from mock import Mock, patch
 
 class TestActions(unittest.TestCase):
 
     def setUp(self):
+        logging.basicConfig(level=logging.CRITICAL)
+        self.path = tempfile.mkdtemp()
+        self.scripts_path = os.path.join(self.path, u'actions')
+        self.patchers = [
+            patch.object(Actions, u'SCRIPTS_PATH', self.scripts_path),
+            patch.object(Actions, u'HISTORY_PATH', os.path.join(self.path, u'history.log')),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
         self.session = session.TestSession(logging.CRITICAL)
-        _action = Actions
-        self.module = self.session.setup(_actions)
+        self.module = self.session.setup(Actions)
+        self.cputimes = {}
 
     def tearDown(self):
         self.session.clean()
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.path)
+
+    def __write_script(self, name, code=u'pass\n'):
+        with io.open(os.path.join(self.scripts_path, name), u'w') as fd:
+            fd.write(code)
+
+    def __wait(self, condition, timeout=5.0):
+        end = time.time() + timeout
+        while not condition() and time.time()<end:
+            time.sleep(0.05)
+
+    def __wait_executions(self, script, count):
+        action = self.module._Actions__scripts[script]
+        self.__wait(lambda: action.get_execution_stats()[u'executions']>=count)
+
+    def __thread_cpu_time(self):
+        #heavy.py consumes 2 seconds per execution, other scripts 0.1 second
+        script = threading.current_thread().name
+        self.cputimes[script] = self.cputimes.get(script, 0.0) + (2.0 if script==u'heavy.py' else 0.1)
+        return self.cputimes[script]
+
+    def test_get_scripts_invalid_sort(self):
+        with self.assertRaises(InvalidParameter):
+            self.module.get_scripts(sort=u'disk')
+
+    @patch(u'backend.action.tracemalloc', None)
+    def test_get_scripts_sort_by_memory_without_tracemalloc(self):
+        with self.assertRaises(InvalidParameter):
+            self.module.get_scripts(sort=u'memory')
+
+    def test_get_scripts_sort_by_cpu(self):
+        for script in (u'light1.py', u'heavy.py', u'light2.py'):
+            self.__write_script(script)
+        self.module._Actions__load_scripts()
+
+        with patch(u'backend.action.thread_cpu_time', side_effect=self.__thread_cpu_time):
+            self.module.event_received({u'event': u'test.event', u'params': {}})
+            self.__wait(lambda: all([script[u'resources'][u'cputime']>0.0 for script in self.module.get_scripts()]))
+
+        scripts = self.module.get_scripts(sort=u'cpu')
+        self.assertEqual(scripts[0][u'name'], u'heavy.py')
+        self.assertAlmostEqual(scripts[0][u'resources'][u'cputime'], 2.0)
+        self.assertAlmostEqual(scripts[1][u'resources'][u'cputime'], 0.1)
+
+    def test_script_exceeding_cpu_limit_is_disabled(self):
+        for script in (u'light1.py', u'heavy.py'):
+            self.__write_script(script)
+        self.module._Actions__load_scripts()
+        self.module.set_resources_limits(1.0, 0)
+
+        with patch(u'backend.action.thread_cpu_time', side_effect=self.__thread_cpu_time):
+            self.module.event_received({u'event': u'test.event', u'params': {}})
+            self.__wait_executions(u'light1.py', 1)
+            self.__wait(lambda: self.module._Actions__scripts[u'heavy.py'].is_disabled())
+
+        disabled = dict([(script[u'name'], script[u'disabled']) for script in self.module.get_scripts()])
+        self.assertEqual(disabled, {u'light1.py': False, u'heavy.py': True})
+        self.assertTrue(self.module._get_config_field(u'scripts')[u'heavy.py'][u'disabled'])
+
+        #disabled script doesn't run anymore
+        self.module.event_received({u'event': u'test.event', u'params': {}})
+        self.__wait_executions(u'light1.py', 2)
+        self.assertEqual(self.module._Actions__scripts[u'heavy.py'].get_execution_stats()[u'executions'], 1)
+
+    def __watch_reloads_and_config_writes(self):
+        self.module._Actions__load_scripts = Mock(wraps=self.module._Actions__load_scripts)
+        self.module._set_config_field = Mock(wraps=self.module._set_config_field)
+
+    def test_add_scripts(self):
+        archive = os.path.join(self.path, u'scripts.zip')
+        with zipfile.ZipFile(archive, u'w') as fd:
+            for i in range(5):
+                fd.writestr(u'script%d.py' % i, b'pass\n')
+        self.__watch_reloads_and_config_writes()
+
+        added = self.module.add_scripts(archive)
+
+        self.assertEqual(sorted(added), [u'script%d.py' % i for i in range(5)])
+        self.assertFalse(os.path.exists(archive))
+        self.assertEqual(sorted([script[u'name'] for script in self.module.get_scripts()]), sorted(added))
+        self.assertEqual(self.module._Actions__load_scripts.call_count, 1)
+        self.assertEqual(self.module._set_config_field.call_count, 1)
+
+    def test_disable_scripts(self):
+        for i in range(5):
+            self.__write_script(u'script%d.py' % i)
+        self.module._Actions__load_scripts()
+        self.__watch_reloads_and_config_writes()
+
+        self.module.disable_scripts([u'script1.py', u'script3.py'], True)
+
+        disabled = sorted([script[u'name'] for script in self.module.get_scripts() if script[u'disabled']])
+        self.assertEqual(disabled, [u'script1.py', u'script3.py'])
+        config = self.module._get_config_field(u'scripts')
+        self.assertTrue(config[u'script1.py'][u'disabled'])
+        self.assertFalse(config[u'script2.py'][u'disabled'])
+        #scripts don't change, no reload needed
+        self.assertEqual(self.module._Actions__load_scripts.call_count, 0)
+        self.assertEqual(self.module._set_config_field.call_count, 1)
+
+    def test_delete_scripts(self):
+        for i in range(5):
+            self.__write_script(u'script%d.py' % i)
+        self.module._Actions__load_scripts()
+        self.__watch_reloads_and_config_writes()
+
+        self.module.delete_scripts([u'script1.py', u'script3.py'])
+
+        self.assertEqual(sorted([script[u'name'] for script in self.module.get_scripts()]), [u'script0.py', u'script2.py', u'script4.py'])
+        self.assertFalse(os.path.exists(os.path.join(self.scripts_path, u'script1.py')))
+        self.assertNotIn(u'script3.py', self.module._get_config_field(u'scripts'))
+        self.assertEqual(self.module._Actions__load_scripts.call_count, 1)
+        self.assertEqual(self.module._set_config_field.call_count, 1)
+
+    def test_bulk_commands_reject_unknown_script(self):
+        for i in range(2):
+            self.__write_script(u'script%d.py' % i)
+        self.module._Actions__load_scripts()
+
+        with self.assertRaises(InvalidParameter):
+            self.module.disable_scripts([u'script0.py', u'unknown.py'], True)
+        with self.assertRaises(InvalidParameter):
+            self.module.delete_scripts([u'script0.py', u'unknown.py'])
+
+        #nothing is changed
+        self.assertTrue(os.path.exists(os.path.join(self.scripts_path, u'script0.py')))
+        self.assertFalse(self.module._get_config_field(u'scripts')[u'script0.py'][u'disabled'])
+
+    def test_export_scripts(self):
+        os.mkdir(os.path.join(self.scripts_path, u'folder'))
+        self.__write_script(u'script1.py')
+        self.__write_script(os.path.join(u'folder', u'script2.py'))
+        self.module._Actions__load_scripts()
+
+        export = self.module.export_scripts()
+
+        with zipfile.ZipFile(export[u'filepath'], u'r') as fd:
+            self.assertEqual(sorted(fd.namelist()), [u'script1.py', u'script2.py'])
+        os.remove(export[u'filepath'])
+
+    def __forward_event(self, name, params, chain):
+        self.module.push = Mock()
+        self.module._Actions__route_event({u'event': name, u'params': params, u'chain': chain}, True)
+        return self.module.push.call_args[0][0]
+
+    def __mock_scripts(self, names):
+        scripts = dict([(name, Mock()) for name in names])
+        self.module._Actions__scripts = scripts
+        return scripts
+
+    def test_forwarded_event_keeps_chain(self):
+        scripts = self.__mock_scripts([u'first.py', u'second.py'])
+        request = self.__forward_event(u'test.step', {u'value': 1}, [u'first.py'])
+        self.assertEqual(request.event, u'test.step')
+        self.assertEqual(request.params[u'value'], 1)
+        self.assertIn(Actions.FORWARDED_EVENT_ID, request.params)
+
+        #event comes back from bus
+        self.module.event_received({u'event': u'test.step', u'params': request.params})
+
+        self.assertFalse(scripts[u'first.py'].push_event.called)
+        event = scripts[u'second.py'].push_event.call_args[0][0]
+        self.assertEqual(event[u'chain'], [u'first.py'])
+        self.assertEqual(event[u'params'], {u'value': 1})
+        self.assertEqual(len(self.module._Actions__forwarded_events), 0)
+
+    def test_event_with_same_name_is_not_chained(self):
+        scripts = self.__mock_scripts([u'first.py', u'second.py'])
+        request = self.__forward_event(u'test.step', {}, [u'first.py'])
+
+        #unrelated event with same name is received before forwarded one
+        self.module.event_received({u'event': u'test.step', u'params': {}})
+        self.assertTrue(scripts[u'first.py'].push_event.called)
+        self.assertNotIn(u'chain', scripts[u'second.py'].push_event.call_args[0][0])
+
+        scripts = self.__mock_scripts([u'first.py', u'second.py'])
+        self.module.event_received({u'event': u'test.step', u'params': request.params})
+        self.assertFalse(scripts[u'first.py'].push_event.called)
+        self.assertEqual(scripts[u'second.py'].push_event.call_args[0][0][u'chain'], [u'first.py'])
+
+    def test_expired_forwarded_events_are_dropped(self):
+        scripts = self.__mock_scripts([u'first.py', u'second.py'])
+        with patch(u'backend.actions.time.time', return_value=1000.0):
+            request = self.__forward_event(u'test.step', {}, [u'first.py'])
+        with patch(u'backend.actions.time.time', return_value=1000.0+Actions.FORWARDED_EVENT_TIMEOUT):
+            self.__forward_event(u'test.other', {}, [u'first.py'])
+        self.assertEqual(len(self.module._Actions__forwarded_events), 1)
+
+        #expired event is received as new event, without its marker
+        self.module.event_received({u'event': u'test.step', u'params': request.params})
+        event = scripts[u'first.py'].push_event.call_args[0][0]
+        self.assertNotIn(u'chain', event)
+        self.assertEqual(event[u'params'], {})
+
+class TestArchiveScripts(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.archive = os.path.join(self.path, u'scripts')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def __make_zip(self, members):
+        with zipfile.ZipFile(self.archive, u'w') as archive:
+            for name, content in members:
+                archive.writestr(name, content)
+
+    def __make_tar(self, members):
+        archive = tarfile.open(self.archive, u'w:gz')
+        try:
+            for name, content in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+        finally:
+            archive.close()
+
+    def test_zip_archive(self):
+        self.__make_zip([
+            (u'script1.py', b'print("1")'),
+            (u'folder/script2.py', b'print("2")'),
+            (u'readme.txt', b'readme'),
+            (u'folder/', b''),
+        ])
+
+        scripts = get_archive_scripts(self.archive)
+        self.assertEqual(sorted(scripts.keys()), [u'script1.py', u'script2.py'])
+        self.assertEqual(scripts[u'script2.py'], u'print("2")')
+
+    def test_tar_archive(self):
+        self.__make_tar([
+            (u'script1.py', b'print("1")'),
+            (u'folder/script2.py', b'print("2")'),
+            (u'readme.txt', b'readme'),
+        ])
+
+        scripts = get_archive_scripts(self.archive)
+        self.assertEqual(sorted(scripts.keys()), [u'script1.py', u'script2.py'])
+        self.assertEqual(scripts[u'script1.py'], u'print("1")')
+
+    def test_path_traversal_is_stripped(self):
+        self.__make_zip([
+            (u'../../etc/evil.py', b'print("evil")'),
+            (u'/absolute/path/script.py', b'print("abs")'),
+        ])
+
+        scripts = get_archive_scripts(self.archive)
+        self.assertEqual(sorted(scripts.keys()), [u'evil.py', u'script.py'])
+
+    def test_duplicated_script_name(self):
+        self.__make_zip([
+            (u'folder1/script.py', b'print("1")'),
+            (u'folder2/script.py', b'print("2")'),
+        ])
+
+        with self.assertRaises(InvalidParameter):
+            get_archive_scripts(self.archive)
+
+    def test_invalid_encoding(self):
+        self.__make_tar([
+            (u'script1.py', b'print("1")'),
+            (u'script2.py', b'print("\xff")'),
+        ])
+
+        with self.assertRaises(InvalidParameter):
+            get_archive_scripts(self.archive)
+
+    def test_invalid_archive(self):
+        with io.open(self.archive, u'wb') as fd:
+            fd.write(b'not an archive')
+
+        with self.assertRaises(InvalidParameter):
+            get_archive_scripts(self.archive)
 
 if __name__ == "__main__":
     unittest.main()
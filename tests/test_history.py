@@ -0,0 +1,153 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.history import HistoryIndex, ExecutionHistory
+from filesystem_mock import FilesystemMock
+import os
+import io
+import shutil
+import tempfile
+
+class TestHistoryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = HistoryIndex()
+        for i in range(10):
+            self.index.add(u'script%d.py' % (i%2), float(i), i*100)
+
+    def test_search_all(self):
+        self.assertEqual(self.index.search(None, None, 100), [900, 800, 700, 600, 500, 400, 300, 200, 100, 0])
+
+    def test_search_limit(self):
+        self.assertEqual(self.index.search(None, None, 3), [900, 800, 700])
+
+    def test_search_since(self):
+        self.assertEqual(self.index.search(None, 7.0, 100), [900, 800, 700])
+        self.assertEqual(self.index.search(None, 6.5, 100), [900, 800, 700])
+        self.assertEqual(self.index.search(None, 10.0, 100), [])
+
+    def test_search_since_and_limit(self):
+        self.assertEqual(self.index.search(None, 2.0, 2), [900, 800])
+
+    def test_search_script(self):
+        self.assertEqual(self.index.search(u'script1.py', None, 100), [900, 700, 500, 300, 100])
+        self.assertEqual(self.index.search(u'script0.py', 5.0, 2), [800, 600])
+
+    def test_search_unknown_script(self):
+        self.assertEqual(self.index.search(u'unknown.py', None, 100), [])
+
+    def test_search_unordered_timestamps(self):
+        index = HistoryIndex()
+        for (offset, timestamp) in enumerate([10.0, 20.0, 30.0, 5.0, 40.0, 50.0]):
+            index.add(u'script.py', timestamp, offset)
+
+        self.assertEqual(index.search(None, 25.0, 100), [5, 4, 2])
+        self.assertEqual(index.search(None, 8.0, 100), [5, 4, 2, 1, 0])
+        self.assertEqual(index.search(u'script.py', 8.0, 4), [5, 4, 2, 1])
+
+    def test_clear(self):
+        self.index.clear()
+        self.assertEqual(self.index.search(None, None, 100), [])
+
+
+
+
+class TestExecutionHistory(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=logging.CRITICAL)
+        self.path = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.path, u'history.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def __fill(self, history, count):
+        for i in range(count):
+            history.add(u'script%d.py' % (i%2), u'test.event', float(i), 0.1, u'Error %d' % i if i==3 else None)
+
+    def test_get(self):
+        history = ExecutionHistory(FilesystemMock(), self.filepath)
+        history.load()
+        self.__fill(history, 5)
+
+        records = history.get()
+        self.assertEqual([record[u'timestamp'] for record in records], [4.0, 3.0, 2.0, 1.0, 0.0])
+        self.assertEqual(records[1][u'script'], u'script1.py')
+        self.assertEqual(records[1][u'event'], u'test.event')
+        self.assertEqual(records[1][u'outcome'], u'error')
+        self.assertEqual(records[1][u'error'], u'Error 3')
+        self.assertEqual(records[0][u'outcome'], u'success')
+        self.assertIsNone(records[0][u'error'])
+
+    def test_get_unordered_records(self):
+        #execution started before previous flushed ones (long execution or clock adjusted)
+        history = ExecutionHistory(FilesystemMock(), self.filepath, flush_count=3)
+        history.load()
+        for timestamp in (10.0, 20.0, 30.0, 5.0, 40.0, 50.0):
+            history.add(u'script.py', u'test.event', timestamp, 0.1)
+
+        records = history.get(since=25.0)
+        self.assertEqual([record[u'timestamp'] for record in records], [50.0, 40.0, 30.0])
+        records = history.get(since=8.0)
+        self.assertEqual([record[u'timestamp'] for record in records], [50.0, 40.0, 30.0, 20.0, 10.0])
+
+    def test_records_are_buffered(self):
+        history = ExecutionHistory(FilesystemMock(), self.filepath, flush_count=3)
+        history.load()
+        self.__fill(history, 2)
+        self.assertFalse(os.path.exists(self.filepath))
+
+        history.add(u'script.py', u'test.event', 2.0, 0.1)
+        self.assertTrue(os.path.exists(self.filepath))
+
+    def test_get_across_rotation(self):
+        history = ExecutionHistory(FilesystemMock(), self.filepath, max_size=300, flush_count=1)
+        history.load()
+        self.__fill(history, 12)
+        self.assertTrue(os.path.exists(u'%s.1' % self.filepath))
+
+        #oldest records are dropped, remaining ones come from current and previous files
+        records = history.get(limit=100)
+        timestamps = [record[u'timestamp'] for record in records]
+        with io.open(self.filepath, u'rb') as fd:
+            current_count = len(fd.readlines())
+        self.assertLess(len(timestamps), 12)
+        self.assertGreater(len(timestamps), current_count)
+        self.assertEqual(timestamps, [float(i) for i in range(11, 11-len(timestamps), -1)])
+
+        #limit spans both files
+        records = history.get(limit=current_count+1)
+        self.assertEqual(len(records), current_count+1)
+        self.assertEqual(records[-1][u'timestamp'], 11.0-current_count)
+
+        #since and script filters
+        records = history.get(script=u'script0.py', since=8.0, limit=100)
+        self.assertEqual([record[u'timestamp'] for record in records], [10.0, 8.0])
+
+    def test_load_existing_history(self):
+        history = ExecutionHistory(FilesystemMock(), self.filepath, max_size=300, flush_count=1)
+        history.load()
+        self.__fill(history, 12)
+        expected = history.get(limit=100)
+
+        history = ExecutionHistory(FilesystemMock(), self.filepath, max_size=300, flush_count=1)
+        history.load()
+        self.assertEqual(history.get(limit=100), expected)
+
+    def test_load_truncated_history(self):
+        with io.open(self.filepath, u'wb') as fd:
+            fd.write(b'{"t":1.0,"s":"script.py","e":"test.event","d":0.1,"o":"success","r":null}\n')
+            fd.write(b'{"t":2.0,"s":"scri')
+
+        history = ExecutionHistory(FilesystemMock(), self.filepath, flush_count=1)
+        history.load()
+        history.add(u'script.py', u'test.event', 3.0, 0.1)
+
+        records = history.get()
+        self.assertEqual([record[u'timestamp'] for record in records], [3.0, 1.0])
+
+if __name__ == "__main__":
+    unittest.main()
+
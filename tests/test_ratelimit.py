@@ -0,0 +1,62 @@
+import unittest
+import sys
+sys.path.append('../')
+from backend.ratelimit import TokenBucket
+from mock import patch
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.time_patcher = patch(u'backend.ratelimit.time.time', side_effect=lambda: self.now)
+        self.time_patcher.start()
+
+    def tearDown(self):
+        self.time_patcher.stop()
+
+    def test_consume_burst(self):
+        bucket = TokenBucket(1.0, 3)
+        self.assertEqual(bucket.consume(), 0.0)
+        self.assertEqual(bucket.consume(), 0.0)
+        self.assertEqual(bucket.consume(), 0.0)
+        self.assertAlmostEqual(bucket.consume(), 1.0)
+
+    def test_consume_refill(self):
+        bucket = TokenBucket(2.0, 1)
+        self.assertEqual(bucket.consume(), 0.0)
+        self.assertAlmostEqual(bucket.consume(), 0.5)
+
+        self.now += 0.25
+        self.assertAlmostEqual(bucket.consume(), 0.25)
+
+        self.now += 0.25
+        self.assertEqual(bucket.consume(), 0.0)
+
+    def test_refill_is_capped_by_burst(self):
+        bucket = TokenBucket(10.0, 2)
+        self.now += 100.0
+        self.assertEqual(bucket.consume(), 0.0)
+        self.assertEqual(bucket.consume(), 0.0)
+        self.assertGreater(bucket.consume(), 0.0)
+
+    def test_refund(self):
+        bucket = TokenBucket(1.0, 1)
+        self.assertEqual(bucket.consume(), 0.0)
+        self.assertGreater(bucket.consume(), 0.0)
+        bucket.refund()
+        self.assertEqual(bucket.consume(), 0.0)
+
+    def test_refund_is_capped_by_burst(self):
+        bucket = TokenBucket(1.0, 1)
+        bucket.refund()
+        bucket.refund()
+        self.assertEqual(bucket.consume(), 0.0)
+        self.assertGreater(bucket.consume(), 0.0)
+
+    def test_burst_is_at_least_one(self):
+        bucket = TokenBucket(1.0, 0)
+        self.assertEqual(bucket.consume(), 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
+
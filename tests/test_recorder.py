@@ -0,0 +1,86 @@
+import unittest
+import logging
+import sys
+sys.path.append('../')
+from backend.recorder import EventRecorder, read_records
+from filesystem_mock import FilesystemMock
+import os
+import io
+import json
+import shutil
+import tempfile
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(level=logging.CRITICAL)
+        self.path = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.path, u'events.rec')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def __write_line(self, fd, record):
+        data = json.dumps(record).encode(u'utf-8')
+        fd.write(b'%d %s\n' % (len(data), data))
+
+    def test_read_records(self):
+        with io.open(self.filepath, u'wb') as fd:
+            self.__write_line(fd, {u't': 1.0, u'e': {u'event': u'test.first', u'params': {}}})
+            self.__write_line(fd, {u't': 2.0, u'e': {u'event': u'test.second', u'params': {u'value': 1}}})
+
+        records = list(read_records(self.filepath))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0], (1.0, {u'event': u'test.first', u'params': {}}))
+        self.assertEqual(records[1][1][u'params'][u'value'], 1)
+
+    def test_read_records_drop_truncated_lines(self):
+        with io.open(self.filepath, u'wb') as fd:
+            self.__write_line(fd, {u't': 1.0, u'e': {u'event': u'test.first', u'params': {}}})
+            #length mismatch
+            fd.write(b'100 {"t":2.0,"e":{}}\n')
+            #invalid json
+            fd.write(b'3 {"t\n')
+            self.__write_line(fd, {u't': 3.0, u'e': {u'event': u'test.third', u'params': {}}})
+            #truncated last line (power loss)
+            fd.write(b'50 {"t":4.0,"e":{"ev')
+
+        records = list(read_records(self.filepath))
+        self.assertEqual([record[0] for record in records], [1.0, 3.0])
+
+    def test_record_and_rotate(self):
+        recorder = EventRecorder(FilesystemMock(), self.filepath, max_size=200, max_files=2)
+        recorder.start()
+        self.assertTrue(recorder.is_recording())
+        for i in range(10):
+            recorder.record({u'event': u'test.event', u'params': {u'index': i}})
+        recorder.stop()
+        self.assertFalse(recorder.is_recording())
+
+        self.assertTrue(os.path.exists(self.filepath))
+        self.assertTrue(os.path.exists(u'%s.1' % self.filepath))
+        self.assertTrue(os.path.exists(u'%s.2' % self.filepath))
+        self.assertFalse(os.path.exists(u'%s.3' % self.filepath))
+        self.assertLessEqual(os.path.getsize(self.filepath), 200)
+        records = list(read_records(self.filepath))
+        self.assertEqual(records[-1][1][u'params'][u'index'], 9)
+
+    def test_record_unserializable_event(self):
+        recorder = EventRecorder(FilesystemMock(), self.filepath)
+        recorder.start()
+        recorder.record({u'event': u'test.bytes', u'params': {u'value': b'\xff'}})
+        recorder.record({u'event': u'test.object', u'params': {u'value': object()}})
+        recorder.stop()
+
+        records = list(read_records(self.filepath))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0][1][u'event'], u'test.object')
+
+    def test_record_when_stopped(self):
+        recorder = EventRecorder(FilesystemMock(), self.filepath)
+        recorder.record({u'event': u'test.event', u'params': {}})
+        self.assertFalse(os.path.exists(self.filepath))
+
+if __name__ == "__main__":
+    unittest.main()
+